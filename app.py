@@ -5,6 +5,8 @@ from screens import IntroScreen, MainScreen, LearningScreen, GameScreen, Transit
 from webcam_handler import WebcamHandler
 from levels import Level
 from kivy.core.window import Window
+import model_registry
+import profiling
 
 if __name__ == "__main__":
     # if len(sys.argv) > 1 and sys.argv[1] == 'godmode':
@@ -12,6 +14,12 @@ if __name__ == "__main__":
     # todo rename
     godmode = (len(sys.argv) > 1 and 'godmode' in sys.argv[1])
     # print('master key', godmode)
+    # Load the recognition model in the background while the screens are built
+    model_registry.warm_up()
+    # Print the stage timings periodically when profiling is on (see profiling.py)
+    if profiling.LOG_INTERVAL:
+        profiling.enable()
+        profiling.start_logging(profiling.LOG_INTERVAL)
     # Create the Kivy screen manager
     sm = ScreenManager()
     webcam = WebcamHandler()
@@ -0,0 +1,90 @@
+'''
+Batched classification for many recognition sessions sharing one model.
+
+Each session submits its feature vectors; a background thread groups them into one
+matrix per model call and sends each probability vector back to the session it came from.
+A batch is sent as soon as it has max_batch vectors, or max_wait_ms after its first vector
+arrived, whichever comes first, so no prediction waits longer than max_wait_ms in the queue.
+'''
+import time
+import threading
+from concurrent.futures import Future
+import numpy as np
+from model_registry import get_model
+import profiling
+
+
+class BatchPredictor():
+    def __init__(self, model=None, max_batch=32, max_wait_ms=5.):
+        assert max_batch > 0, 'Batch size must be a positive number'
+        self.model = model
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.
+        self.num_batches = 0
+        self.num_predictions = 0
+        self._pending = []
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def submit(self, features, callback=None):
+        '''
+        Queues one feature vector for classification.
+        Returns a Future whose result is the vector of class probabilities.
+        If callback is given, it is called with the probabilities on the batching thread.
+        '''
+        future = Future()
+        if callback:
+            future.add_done_callback(lambda f: f.exception() is None and callback(f.result()))
+        with self._cond:
+            assert not self._closed, 'BatchPredictor is closed'
+            self._pending.append((np.asarray(features), future, time.monotonic()))
+            if len(self._pending) >= self.max_batch or len(self._pending) == 1:
+                self._cond.notify()
+        return future
+
+    def predict(self, features, timeout=None):
+        '''
+        Blocking version of submit: returns the class probabilities.
+        '''
+        return self.submit(features).result(timeout)
+
+    def mean_batch_size(self):
+        return self.num_predictions / self.num_batches if self.num_batches else 0.
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                # wait for a full batch, but not past the deadline of the oldest vector
+                deadline = self._pending[0][2] + self.max_wait
+                while len(self._pending) < self.max_batch and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = self._pending[:self.max_batch]
+                self._pending = self._pending[self.max_batch:]
+
+            try:
+                model = self.model or get_model()
+                with profiling.timer('predict_batch'):
+                    probs = model.predict_proba(np.stack([features for features, _, _ in batch]))
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            self.num_batches += 1
+            self.num_predictions += len(batch)
+            for (_, future, _), prob in zip(batch, probs):
+                future.set_result(prob)
@@ -0,0 +1,176 @@
+'''
+Headless end-to-end benchmark of the recognition path.
+
+Replays test_webcam_data/[LETTER].mp4 through VideoHandler.process_frame (landmarks, features,
+classification and annotation, no Kivy and no imshow) and reports:
+- frames per second and p50/p95/p99 per-frame latency
+- time to the first correct prediction of each letter, in video time and in processing time
+- accuracy, with the same majority vote as VideoHandler.evaluate_model
+
+The results are written as JSON, together with the machine, code version and settings,
+so runs can be compared. They go to benchmark_results/ (not tracked by git) by default:
+python benchmark.py --out benchmark_results/my_machine.json
+'''
+import os
+import json
+import time
+import string
+import platform
+import argparse
+import subprocess
+import cv2
+import numpy as np
+import profiling
+from video_handler import VideoHandler, ensure_test_data, POSE_STRIDE, INFERENCE_WIDTH, HAND_ROI, LATENCY_BUDGET_MS
+
+PERCENTILES = (50, 95, 99)
+# Default output folder, ignored by git
+RESULTS_DIR = 'benchmark_results'
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def machine_info():
+    return {
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'python': platform.python_version(),
+        'opencv': cv2.__version__,
+        'numpy': np.__version__,
+    }
+
+def latency_summary(latencies):
+    '''
+    Per-frame latencies in seconds -> dict of mean and percentiles in ms.
+    '''
+    latencies = np.asarray(latencies) * 1000
+    summary = {'mean_ms': round(float(latencies.mean()), 3)}
+    for p in PERCENTILES:
+        summary['p{}_ms'.format(p)] = round(float(np.percentile(latencies, p)), 3)
+    return summary
+
+def benchmark_letter(handler, letter):
+    '''
+    Runs one test video through the handler and returns its per-frame latencies and results.
+    '''
+    handler.load_source('test_webcam_data/{}.mp4'.format(letter))
+    handler.reset()
+    fps = handler.cap.get(cv2.CAP_PROP_FPS) or 30.
+    latencies = []
+    preds = []
+    first_correct = None
+    while True:
+        image = handler.read_frame()
+        if image is None:
+            break
+        start = time.perf_counter()
+        _, pred, score = handler.process_frame(image)
+        latencies.append(time.perf_counter() - start)
+        if pred in ('Neutral', 'No hands detected'):
+            continue
+        pred = pred.replace('LETTER-', '')
+        preds.append(pred)
+        if pred == letter and first_correct is None:
+            frame_idx = len(latencies) - 1
+            first_correct = {
+                'frame': frame_idx,
+                'video_s': round(frame_idx / fps, 3),
+                'processing_s': round(sum(latencies), 3),
+            }
+
+    final_pred = max(set(preds), key=preds.count) if preds else None
+    return latencies, {
+        'frames': len(latencies),
+        'fps': round(len(latencies) / sum(latencies), 2) if latencies else 0.,
+        'prediction': final_pred,
+        'correct': final_pred == letter,
+        'first_correct': first_correct,
+        'latency': latency_summary(latencies) if latencies else None,
+    }
+
+def run_benchmark(letters=string.ascii_uppercase, pose_stride=POSE_STRIDE, inference_width=INFERENCE_WIDTH,
+                  hand_roi=HAND_ROI, latency_budget_ms=LATENCY_BUDGET_MS, profile=False, verbose=True):
+    '''
+    Benchmarks the given letters and returns the results as a dict (see module docstring).
+    With profile=True, the per-stage timings (see profiling.py) are included under 'stages'.
+    '''
+    ensure_test_data()
+    if profile:
+        profiling.enable()
+        profiling.reset()
+    settings = {'pose_stride': pose_stride, 'inference_width': inference_width,
+                'hand_roi': hand_roi, 'latency_budget_ms': latency_budget_ms}
+    handler = VideoHandler('test_webcam_data/{}.mp4'.format(letters[0]), **settings)
+
+    all_latencies = []
+    per_letter = {}
+    for letter in letters:
+        latencies, result = benchmark_letter(handler, letter)
+        all_latencies.extend(latencies)
+        per_letter[letter] = result
+        if verbose:
+            first = result['first_correct']
+            print('{}: {:4d} frames, {:6.1f} fps, prediction {}, first correct {}'.format(
+                letter, result['frames'], result['fps'], result['prediction'],
+                '{:.2f}s'.format(first['video_s']) if first else '-'))
+
+    first_correct = [r['first_correct']['video_s'] for r in per_letter.values() if r['first_correct']]
+    num_correct = sum(r['correct'] for r in per_letter.values())
+    summary = {
+        'frames': len(all_latencies),
+        'fps': round(len(all_latencies) / sum(all_latencies), 2) if all_latencies else 0.,
+        'latency': latency_summary(all_latencies) if all_latencies else None,
+        'accuracy': round(num_correct / len(letters), 4),
+        'num_correct': num_correct,
+        'num_letters': len(letters),
+        'mean_first_correct_s': round(float(np.mean(first_correct)), 3) if first_correct else None,
+    }
+    results = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': git_commit(),
+        'machine': machine_info(),
+        'settings': settings,
+        'summary': summary,
+        'letters': per_letter,
+    }
+    if profile:
+        results['stages'] = profiling.snapshot()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--out', default=os.path.join(RESULTS_DIR, 'latest.json'),
+                        help='where to write the JSON results (default: {}/latest.json)'.format(RESULTS_DIR))
+    parser.add_argument('--letters', default=string.ascii_uppercase, help='letters to test (default: all)')
+    parser.add_argument('--pose-stride', type=int, default=POSE_STRIDE)
+    parser.add_argument('--inference-width', type=int, default=INFERENCE_WIDTH)
+    parser.add_argument('--hand-roi', action='store_true', default=HAND_ROI)
+    parser.add_argument('--budget-ms', type=float, default=LATENCY_BUDGET_MS,
+                        help='enables the adaptive scheduler with this per-frame budget')
+    parser.add_argument('--profile', action='store_true', help='also record per-stage timings')
+    args = parser.parse_args()
+
+    results = run_benchmark(args.letters.upper(), args.pose_stride, args.inference_width,
+                            args.hand_roi, args.budget_ms, args.profile)
+    summary = results['summary']
+    print('\n{} frames at {} fps, latency p50 {} ms, p95 {} ms, p99 {} ms'.format(
+        summary['frames'], summary['fps'], summary['latency']['p50_ms'],
+        summary['latency']['p95_ms'], summary['latency']['p99_ms']))
+    print('Accuracy: {}/{}, mean time to first correct prediction: {}s'.format(
+        summary['num_correct'], summary['num_letters'], summary['mean_first_correct_s']))
+    if args.profile:
+        print(profiling.format_table(results['stages']))
+
+    out_dir = os.path.dirname(args.out)
+    if out_dir and not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+    with open(args.out, 'w') as f:
+        json.dump(results, f, indent=2)
+    print('Results written to', args.out)
@@ -1,4 +1,4 @@
-import cv2
+import time
 import numpy as np
 from kivy import metrics
 from kivy.core.window import Window
@@ -7,9 +7,12 @@ from kivy.graphics.texture import Texture
 from kivy.graphics.instructions import InstructionGroup
 from kivy.uix.label import Label
 from kivy.uix.image import Image
-from kivy.graphics import Line, Color, Rectangle
+from kivy.graphics import Line, Color, Rectangle, Mesh
 from common.gfxutil import CLabelRect
 from video_handler import VideoHandler
+from utils import mp_hands, mp_pose, HAND_COLS
+from guide_video import GuidePlayer
+import profiling
 
 font_sz = metrics.dp(50)
 font_name = "assets/AtlantisInternational"
@@ -117,10 +120,23 @@ class VideoDisplay(Rectangle):
     def __init__(self, vid_src, position, **kwargs):
         super(VideoDisplay, self).__init__(**kwargs)
         self.position = position
-        self.video = VideoHandler(vid_src)
+        self.predict = vid_src == 0
+        self.overlay = None
+        if self.predict:
+            # Run webcam recognition off the UI thread so the display keeps up with the frame rate.
+            # Landmarks and prediction are drawn over the raw frame by the overlay (add it to the canvas after the display)
+            self.video = VideoHandler(vid_src, threaded=True, draw_on_frame=False)
+            self.overlay = LandmarkOverlay(self)
+        else:
+            # Guide videos are decoded once at display size and cached (see guide_video.py)
+            self.video = GuidePlayer(vid_src, width=int(0.5*w))
+        # Webcam frames come out of VideoHandler mirrored already, guide videos are mirrored on display
+        self.mirror = not self.predict
+        self.frame = None
+        # One texture per source resolution, reused for every frame
+        self.frame_texture = None
         self.size = (0.5*w,0.375*h)
         self.move_to(position)
-        self.predict = vid_src == 0
     
     def move_to(self, position):
         self.position = position
@@ -134,29 +150,48 @@ class VideoDisplay(Rectangle):
         else:
             # Center
             self.pos = (0.25*w, 0.3*h)
+        # the overlay is drawn in display coordinates: move the skeleton and the label along
+        if self.overlay:
+            self.overlay.on_layout()
 
     def on_update(self):
         if self.predict:
             result = self.video.get_next_frame()
             if result is not None:
                 frame, pred, score = result
-                buf = cv2.flip(frame, 0)
-                buf = buf.tostring()
-                texture = Texture.create(size=(frame.shape[1], frame.shape[0]), colorfmt='bgr')
-                texture.blit_buffer(buf, colorfmt='bgr', bufferfmt='ubyte')
-                self.texture = texture
+                with profiling.timer('texture'):
+                    self.upload(frame)
+                with profiling.timer('overlay'):
+                    self.overlay.update(self.video.display_landmarks, pred, score)
                 return pred, score
 
         else:
             frame = self.video.get_frame()
             if frame is not None:
-                buf = cv2.flip(frame, 0)
-                buf = cv2.flip(buf, 1)
-                buf = buf.tostring()
-                texture = Texture.create(size=(frame.shape[1], frame.shape[0]), colorfmt='bgr')
-                texture.blit_buffer(buf, colorfmt='bgr', bufferfmt='ubyte')
-                self.texture = texture
+                # the guide clip holds its frame when the UI runs faster than the clip
+                if frame is self.frame:
+                    return True
+                self.frame = frame
+                with profiling.timer('guide_texture'):
+                    self.upload(frame)
                 return True
+
+    def upload(self, frame):
+        '''
+        Copies a BGR frame into the display texture, straight from the array's memory.
+        The texture is only created again when the frame size changes, and flips are done
+        with its texture coordinates rather than by copying pixels.
+        '''
+        height, width = frame.shape[:2]
+        if self.frame_texture is None or self.frame_texture.size != (width, height):
+            self.frame_texture = Texture.create(size=(width, height), colorfmt='bgr')
+            # frames are stored top row first, textures bottom row first
+            self.frame_texture.flip_vertical()
+            if self.mirror:
+                self.frame_texture.flip_horizontal()
+            self.texture = self.frame_texture
+        self.frame_texture.blit_buffer(np.ascontiguousarray(frame).reshape(-1), colorfmt='bgr', bufferfmt='ubyte')
+        self.flag_update()
     
     def on_layout(self, win_size):
         w, h = win_size
@@ -165,9 +200,154 @@ class VideoDisplay(Rectangle):
     
     def load_source(self, vid_src):
         self.video.load_source(vid_src)
+
+
+def _edges(connections):
+    return np.array(sorted((int(a), int(b)) for a, b in connections), dtype=int)
+
+# Quad corners of a segment (p0, p1): p0+n, p0-n, p1-n, p1+n, as two triangles
+_QUAD_INDICES = np.array([0, 1, 2, 0, 2, 3])
+
+def _quads_mesh(mesh, corners):
+    '''
+    Sets the vertices of a triangles Mesh to the given (num_quads, 4, 2) quad corners.
+    '''
+    vertices = np.zeros((len(corners), 4, 4))
+    vertices[:, :, :2] = corners
+    mesh.vertices = vertices.ravel().tolist()
+    mesh.indices = (np.arange(len(corners))[:, None] * 4 + _QUAD_INDICES).ravel().tolist()
+
+
+class LandmarkOverlay(InstructionGroup):
+    '''
+    Draws the hand and pose skeletons and the prediction over a VideoDisplay as Kivy instructions,
+    so the frame itself is uploaded without any cv2 drawing.
+    The skeleton is two reused Meshes (bones and joints) whose vertices are set from the
+    landmark row (see utils.COLUMNS), so the cost depends on the number of landmarks,
+    not on the frame size. The prediction label is only rendered again when its text changes.
+    '''
+    HAND_EDGES = _edges(mp_hands.HAND_CONNECTIONS)
+    POSE_EDGES = _edges(mp_pose.UPPER_BODY_POSE_CONNECTIONS)
+    BONE_WIDTH = 2.
+    JOINT_SIZE = 3.
+    # same colors as the cv2 version
+    COLORS = {'No hands detected': (1,0,0), 'Neutral': (0,0,1)}
+    PREDICTION_COLOR = (0,150/255.,0)
+
+    def __init__(self, display):
+        super(LandmarkOverlay, self).__init__()
+        self.display = display
+        self.landmarks = None
+        self.text = None
+        # mp_drawing colors: green connections, red landmarks
+        self.add(Color(0,1,0))
+        self.bones = Mesh(mode='triangles')
+        self.add(self.bones)
+        self.add(Color(1,0,0))
+        self.joints = Mesh(mode='triangles')
+        self.add(self.joints)
+        self.label_color = Color(1,1,1)
+        self.add(self.label_color)
+        self.label = CLabelRect(cpos=(0,0), text=' ', font_size=font_sz/3)
+        self.add(self.label)
+        # don't tint whatever is drawn after the overlay
+        self.add(Color(1,1,1,1))
+
+    def update(self, landmarks, prediction, score):
+        self.landmarks = landmarks
+        self.update_skeleton()
+        text = prediction + '  ' + score if prediction else ''
+        if text != self.text:
+            self.text = text
+            self.label_color.rgb = self.COLORS.get(prediction, self.PREDICTION_COLOR)
+            self.label.set_text(text)
+            self.place_label()
+
+    def update_skeleton(self):
+        if self.landmarks is None:
+            _quads_mesh(self.bones, np.empty((0, 4, 2)))
+            _quads_mesh(self.joints, np.empty((0, 4, 2)))
+            return
+        # normalized image coordinates (y down) to display coordinates (y up)
+        x, y = self.display.pos
+        width, height = self.display.size
+        points = self.landmarks[1:].reshape(-1, 3)[:, :2] * (width, -height) + (x, y + height)
+        num_hand_joints = HAND_COLS // 3
+        edges = np.concatenate([self.HAND_EDGES, self.HAND_EDGES + num_hand_joints,
+                                self.POSE_EDGES + 2*num_hand_joints])
+
+        segments = points[edges]
+        segments = segments[~np.isnan(segments).any(axis=(1, 2))]
+        direction = segments[:, 1] - segments[:, 0]
+        length = np.hypot(direction[:, 0], direction[:, 1])[:, None]
+        normal = direction[:, ::-1] * (-1, 1) / np.maximum(length, 1e-6) * self.BONE_WIDTH / 2
+        _quads_mesh(self.bones, np.stack([segments[:, 0] + normal, segments[:, 0] - normal,
+                                          segments[:, 1] - normal, segments[:, 1] + normal], axis=1))
+
+        joints = points[~np.isnan(points).any(axis=1)]
+        corners = np.array([(-1, -1), (1, -1), (1, 1), (-1, 1)]) * self.JOINT_SIZE
+        _quads_mesh(self.joints, joints[:, None] + corners)
+
+    def place_label(self):
+        x, y = self.display.pos
+        width, height = self.display.size
+        label_width = self.label.label.texture_size[0]
+        self.label.set_cpos((x + 0.08*width + label_width/2, y + 0.85*height))
+
+    def on_layout(self):
+        self.update_skeleton()
+        self.place_label()
         
 
 
+class ProfilerDisplay(InstructionGroup):
+    '''
+    Overlay with the p50/p95/p99 time (ms) of each recognition stage, see profiling.py.
+    Showing it turns profiling on and hiding it turns it back off, unless it was on already
+    (ASLINGO_PROFILE, ASLINGO_PROFILE_LOG). The text is refreshed every refresh_interval seconds.
+    '''
+    def __init__(self, refresh_interval=0.5):
+        super(ProfilerDisplay, self).__init__()
+        self.refresh_interval = refresh_interval
+        self.last_refresh = 0.
+        self.active = False
+        # whether profiling was on before the overlay was shown
+        self.was_enabled = False
+        self.add(Color(0,0,0,0.6))
+        self.background = Rectangle()
+        self.add(self.background)
+        self.add(Color(1,1,1,1))
+        self.text = CLabelRect(cpos=(0,0), text=profiling.format_table(), font_size=font_sz/5,
+                               font_name='RobotoMono-Regular')
+        self.add(self.text)
+        self.on_layout(Window.size)
+
+    def toggle(self):
+        self.active = not self.active
+        if self.active:
+            self.was_enabled = profiling.is_enabled()
+            profiling.enable()
+        else:
+            profiling.enable(self.was_enabled)
+        return self.active
+
+    def on_update(self):
+        now = time.monotonic()
+        if now - self.last_refresh < self.refresh_interval:
+            return
+        self.last_refresh = now
+        self.text.set_text(profiling.format_table())
+        self.on_layout(Window.size)
+
+    def on_layout(self, win_size):
+        w, h = win_size
+        tw, th = self.text.label.texture_size
+        # top right corner
+        self.text.set_cpos((w - tw/2 - 20, h - th/2 - 20))
+        self.background.pos = (w - tw - 30, h - th - 30)
+        self.background.size = (tw + 20, th + 20)
+
+
 class HelpDisplay(InstructionGroup):
     '''
     Help Overlay.
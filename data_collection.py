@@ -1,18 +1,44 @@
 import os
-import json
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from letters_dict import letter_vids
-from utils import mp_process_video, generate_dataframe
+from utils import iter_video_landmarks, LandmarkExtractor, COLUMNS, NUM_COLUMNS
+from dataset_store import LandmarkStoreWriter, CsvSampleWriter, ArraySampleWriter, write_rows, convert_csv_tree, store_exists
+from dataset_manifest import DatasetManifest
 
 
-def save_parsed_data(video_metadata, dataframe):
+_manifest = None
+
+def get_manifest():
+    '''
+    Returns the DatasetManifest of data/, shared by every save in this process.
+    '''
+    global _manifest
+    if _manifest is None:
+        _manifest = DatasetManifest('data')
+    return _manifest
+
+def next_sample_idx(word):
+    '''
+    Returns the next sample_idx that is not used yet in data/[WORD]/
+    '''
+    return get_manifest().next_sample_idx(word)
+
+def save_parsed_data(video_metadata, dataframe, sample_idx=None, manifest=None):
     '''
     Save the video information and metadata in two separate files.
-    The word, video_path, and synonyms from video_metadata is saved in data/metadata.json
+    dataframe is a DataFrame or array of the parsed rows, or an iterable of rows
+    (e.g. utils.iter_video_landmarks) which is written out as it is consumed.
+    The word, video_path, and synonyms from video_metadata is registered in data/manifest.jsonl
+    (see dataset_manifest.py); data/metadata.json is only exported from it by collect_data,
+    read the saved samples with load_metadata().
     Timestamped hand and pose information is saved in data/[WORD]/[sample_idx].csv
-    where sample_idx is a 0-indexed counter for differentiating distinct video samples.
+    where sample_idx is a 0-indexed counter for differentiating distinct video samples,
+    and appended to the binary landmark store in data/ (see dataset_store.py).
+    If sample_idx is not given, the next free one is allocated.
     '''
-    if not os.path.isdir('data'):
-        os.mkdir('data')
+    manifest = manifest or get_manifest()
 
     word = video_metadata['word']
     synonyms = video_metadata['synonyms']
@@ -22,53 +48,114 @@ def save_parsed_data(video_metadata, dataframe):
     if not os.path.isdir(os.path.join('data', word)):
         os.mkdir(os.path.join('data', word))
 
-    sample_idx = 0
+    if sample_idx is None:
+        sample_idx = manifest.allocate(word)
     data_path = os.path.join('data', word, str(sample_idx) + '.csv')
-    while os.path.exists(data_path):
-        sample_idx += 1
-        data_path = os.path.join('data', word, str(sample_idx) + '.csv')
 
-    dataframe.to_csv(data_path, index=False)
+    columns = list(getattr(dataframe, 'columns', COLUMNS))
+    rows = dataframe.to_numpy() if hasattr(dataframe, 'to_numpy') else dataframe
+    if store_exists('data'):
+        # one pass over the rows writes both the csv file and the store
+        store_writer = LandmarkStoreWriter('data', columns=columns).open_sample(word, sample_idx)
+        write_rows(rows, CsvSampleWriter(data_path, columns), store_writer)
+    else:
+        write_rows(rows, CsvSampleWriter(data_path, columns))
+        # first sample saved since the store was added: build it from all the csv files
+        convert_csv_tree('data')
 
-    # Save metadata
-    metadata = {}
-    metadata_path = os.path.join('data', 'metadata.json')
-    if os.path.exists(metadata_path):
-        with open(metadata_path) as f:
-            metadata = json.load(f)
+    # Save metadata, once the data is on disk
+    manifest.register(word, sample_idx, video_src, synonyms)
 
-    entry = {'synonyms': synonyms, 'video_src': {}}
-    if metadata.get(word):
-        entry = metadata.get(word)
-
-    entry['video_src'][str(sample_idx)] = video_src
+def load_metadata():
+    '''
+    Returns the saved samples in the data/metadata.json layout.
+    '''
+    return get_manifest().metadata()
 
-    metadata[word] = entry
+def _extract_video(word, sample_idx, video_src, num_hands=1):
+    '''
+    Worker job: process one video end to end and return its parsed rows as an array.
+    '''
+    rows = ArraySampleWriter(NUM_COLUMNS)
+    _save_video(video_src, lambda video_rows: write_rows(video_rows, rows), num_hands)
+    return word, sample_idx, video_src, rows.array()
 
-    to_json = json.dumps(metadata)
-    with open(metadata_path, 'w') as f:
-        f.write(to_json)
-        f.close()
+def _save_video(video_src, save, num_hands=1):
+    '''
+    Streams the parsed rows of a video to save(rows).
+    Every video gets fresh MediaPipe graphs, in the sequential and the parallel runs alike,
+    so the result doesn't depend on which video was tracked before.
+    '''
+    extractor = LandmarkExtractor(num_hands=num_hands)
+    try:
+        save(iter_video_landmarks(video_src, extractor=extractor))
+    finally:
+        extractor.close()
 
-def collect_data():
+def collect_data(workers=1):
+    '''
+    Processes every video in letter_vids and saves the parsed data.
+    With workers > 1, videos are processed in parallel by a pool of processes.
+    Sample indices are allocated up front in letter_vids order, and every video is processed
+    with fresh MediaPipe graphs in both modes, so the output is the same as a sequential run,
+    and only this process writes the files.
+    A video that fails is reported and skipped (its sample index stays unused), and the
+    other videos are still collected.
+    data/metadata.json is exported from the manifest at the end.
+    '''
     if os.path.exists('data'):
         print('data folder already exists. continue? y/[n]')
         if input().lower() != 'y':
             return
 
+    manifest = get_manifest()
+    if workers <= 1:
+        for letter in letter_vids:
+            print('Collecting data for:', letter)
+            for video_src in letter_vids[letter]:
+                video_metadata = {'word': letter,
+                                  'synonyms': [],
+                                  'video_src': video_src}
+                sample_idx = manifest.allocate(letter)
+                try:
+                    # Process video with mediapipe to get hand and pose data,
+                    # parsed into rows and saved frame by frame
+                    _save_video(video_src, lambda rows: save_parsed_data(
+                        video_metadata, rows, sample_idx=sample_idx, manifest=manifest))
+                except Exception as e:
+                    print('ERROR: failed to collect data for: {} ({}): {}'.format(letter, sample_idx, e))
+        manifest.export_metadata()
+        return
+
+    jobs = []
     for letter in letter_vids:
-        print('Collecting data for:', letter)
         for video_src in letter_vids[letter]:
-            # Process video with mediapipe to get hand and pose data
-            processed = mp_process_video(video_src, num_hands=1)
-            # Parse intermediate mediapipe data into a pd dataframe
-            df = generate_dataframe(processed)
-            video_metadata = {'word': letter,
+            jobs.append((letter, manifest.allocate(letter), video_src))
+
+    # spawn, so that no MediaPipe graph state is shared with the parent through fork
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        futures = {pool.submit(_extract_video, *job): job for job in jobs}
+        for done, future in enumerate(as_completed(futures)):
+            word, sample_idx, video_src = futures[future]
+            try:
+                _, _, _, rows = future.result()
+            except Exception as e:
+                print('[{}/{}] ERROR: failed to collect data for: {} ({}): {}'.format(
+                    done+1, len(jobs), word, sample_idx, e))
+                continue
+            print('[{}/{}] Collected data for: {} ({})'.format(done+1, len(jobs), word, sample_idx))
+            video_metadata = {'word': word,
                               'synonyms': [],
                               'video_src': video_src}
-            # Save data
-            save_parsed_data(video_metadata, df)
+            save_parsed_data(video_metadata, rows, sample_idx=sample_idx, manifest=manifest)
 
+    # Videos finish in any order, the export is ordered like a sequential run
+    manifest.export_metadata()
 
 if __name__ == "__main__":
-    collect_data()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-j', '--workers', type=int, default=1,
+                        help='number of processes to extract landmarks with (default: 1)')
+    args = parser.parse_args()
+    collect_data(workers=args.workers)
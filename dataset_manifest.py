@@ -0,0 +1,202 @@
+'''
+Dataset manifest: which video every data/[WORD]/[sample_idx].csv sample comes from.
+
+The manifest is an append-only file, data/manifest.jsonl, with one line per event:
+- {"word": "LETTER-A", "sample": 3}: sample index 3 of LETTER-A is taken (allocated)
+- {"word": "LETTER-A", "sample": 3, "video_src": "...", "synonyms": []}: the sample is saved
+
+Allocating or registering a sample appends one line under a file lock, so it takes the same
+time however big the dataset is, and several processes can add samples at once without
+taking the same index. A line is only complete once its newline is written: a crash part
+way leaves a partial line that is skipped when reading. If a sample is registered again,
+the last line wins.
+
+data/metadata.json, in the layout described in the README, is only an export of the manifest
+for reading outside the app, and is out of date until it is exported again:
+python dataset_manifest.py export
+The code reads the manifest (DatasetManifest.metadata()). An existing metadata.json (and the
+csv files next to it) is imported the first time the manifest is opened, by one process only:
+the others wait on data/manifest.jsonl.lock and then read the imported manifest.
+'''
+import os
+import sys
+import json
+from contextlib import contextmanager
+from dataset_store import _write_atomic
+try:
+    import fcntl
+except ImportError:
+    # no file locks (Windows): only one process should add samples at a time
+    fcntl = None
+
+MANIFEST_FILE = 'manifest.jsonl'
+LOCK_FILE = 'manifest.jsonl.lock'
+METADATA_FILE = 'metadata.json'
+
+
+@contextmanager
+def _flock(f):
+    '''
+    Holds an exclusive lock on the open file f.
+    '''
+    if fcntl:
+        fcntl.flock(f, fcntl.LOCK_EX)
+    try:
+        yield f
+    finally:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class DatasetManifest():
+    '''
+    The samples of a data folder, read from its manifest and kept up to date with the lines
+    other processes append. manifest.next_sample_idx('LETTER-A') is the per-word counter.
+    '''
+    def __init__(self, path='data'):
+        self.path = path
+        self.manifest_path = os.path.join(path, MANIFEST_FILE)
+        self.samples = {}
+        self.synonyms = {}
+        self.counters = {}
+        self._offset = 0
+        if not os.path.exists(self.manifest_path):
+            import_metadata(path)
+        self._refresh()
+
+    def _refresh(self):
+        '''
+        Reads the lines appended since the last refresh.
+        '''
+        with open(self.manifest_path, 'rb') as f:
+            f.seek(self._offset)
+            data = f.read()
+        # leave a partial last line for later: it is either being written or was cut short
+        end = data.rfind(b'\n') + 1
+        self._offset += end
+        for line in data[:end].splitlines():
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            self._add(entry)
+
+    def _add(self, entry):
+        word, sample = entry['word'], entry['sample']
+        self.counters[word] = max(self.counters.get(word, 0), sample + 1)
+        if 'video_src' in entry:
+            self.samples[(word, sample)] = entry['video_src']
+            self.synonyms.setdefault(word, entry.get('synonyms', []))
+
+    @contextmanager
+    def _locked(self):
+        with open(self.manifest_path, 'a+b') as f, _flock(f):
+            self._refresh()
+            yield f
+
+    def _append(self, f, entry):
+        f.seek(0, os.SEEK_END)
+        # don't glue this entry onto a partially written line
+        newline = b'\n' if f.tell() and not self._ends_with_newline(f) else b''
+        f.write(newline + json.dumps(entry).encode() + b'\n')
+        f.flush()
+        os.fsync(f.fileno())
+        self._offset = f.tell()
+        self._add(entry)
+
+    def _ends_with_newline(self, f):
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b'\n'
+
+    def next_sample_idx(self, word):
+        '''
+        Returns the next free sample index of word (one past the highest one taken).
+        '''
+        self._refresh()
+        return self.counters.get(word, 0)
+
+    def allocate(self, word):
+        '''
+        Takes the next free sample index of word and returns it.
+        '''
+        with self._locked() as f:
+            sample = self.counters.get(word, 0)
+            self._append(f, {'word': word, 'sample': sample})
+        return sample
+
+    def register(self, word, sample, video_src, synonyms=()):
+        '''
+        Records that sample (an allocated index, or None to take the next one) of word was
+        saved from video_src. Returns the sample index.
+        '''
+        with self._locked() as f:
+            if sample is None:
+                sample = self.counters.get(word, 0)
+            self._append(f, {'word': word, 'sample': int(sample), 'video_src': video_src,
+                             'synonyms': list(synonyms)})
+        return sample
+
+    def metadata(self):
+        '''
+        Returns the samples in the metadata.json layout:
+        {word: {'synonyms': [...], 'video_src': {'0': video_src, ...}}}
+        Words are in the order they were first added, samples in index order.
+        '''
+        self._refresh()
+        metadata = {}
+        for word in self.counters:
+            video_src = {str(sample): self.samples[(word, sample)]
+                         for sample in range(self.counters[word]) if (word, sample) in self.samples}
+            if video_src:
+                metadata[word] = {'synonyms': self.synonyms[word], 'video_src': video_src}
+        return metadata
+
+    def export_metadata(self, metadata_path=None):
+        '''
+        Writes the manifest to metadata.json (in the data folder by default), atomically.
+        '''
+        metadata_path = metadata_path or os.path.join(self.path, METADATA_FILE)
+        _write_atomic(metadata_path, json.dumps(self.metadata()))
+
+
+def import_metadata(path='data'):
+    '''
+    Creates the manifest of a data folder from its metadata.json, if there is one, and from
+    its csv files: indices that have a csv file but no metadata entry are marked as taken.
+    Does nothing if the folder has a manifest already.
+    '''
+    os.makedirs(path, exist_ok=True)
+    # the manifest is replaced as a whole, so it must not exist yet: only one process imports,
+    # and once it exists the others only append to it
+    with open(os.path.join(path, LOCK_FILE), 'a') as lock, _flock(lock):
+        if not os.path.exists(os.path.join(path, MANIFEST_FILE)):
+            _import_metadata(path)
+
+def _import_metadata(path):
+    lines = []
+    taken = set()
+    metadata_path = os.path.join(path, METADATA_FILE)
+    if os.path.exists(metadata_path):
+        with open(metadata_path) as f:
+            metadata = json.load(f)
+        for word, entry in metadata.items():
+            for sample, video_src in sorted(entry['video_src'].items(), key=lambda item: int(item[0])):
+                lines.append({'word': word, 'sample': int(sample), 'video_src': video_src,
+                              'synonyms': entry['synonyms']})
+                taken.add((word, int(sample)))
+    for word in sorted(os.listdir(path)):
+        word_dir = os.path.join(path, word)
+        if not os.path.isdir(word_dir):
+            continue
+        for file in os.listdir(word_dir):
+            name, ext = os.path.splitext(file)
+            if ext == '.csv' and name.isdigit() and (word, int(name)) not in taken:
+                lines.append({'word': word, 'sample': int(name)})
+    _write_atomic(os.path.join(path, MANIFEST_FILE), ''.join(json.dumps(line) + '\n' for line in lines))
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ['export']:
+        DatasetManifest(*sys.argv[2:3]).export_metadata()
+    else:
+        print('usage: python dataset_manifest.py export [data_dir]')
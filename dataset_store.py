@@ -0,0 +1,301 @@
+'''
+Binary landmark dataset store.
+
+A store is two files in a directory (data/ by default):
+- landmarks.bin: the frames of every sample as float32 rows, back to back
+- landmarks_index.jsonl: the column names on the first line, then one line per sample:
+  {"label": "LETTER-A", "sample": 0, "offset": <first row>, "length": <num rows>}
+
+Samples are appended: the rows go to the end of landmarks.bin first, and then the index line
+is appended, so a crash can never leave an index entry pointing at missing data.
+If a (label, sample) pair is written again, the last index entry wins.
+The whole store is read with a single np.memmap, no csv parsing or pandas needed.
+'''
+import os
+import sys
+import json
+import numpy as np
+
+DATA_FILE = 'landmarks.bin'
+INDEX_FILE = 'landmarks_index.jsonl'
+DTYPE = np.float32
+
+
+class LandmarkStore():
+    '''
+    Read-only, memory-mapped view of a landmark store.
+    store.get('LETTER-A', 0) returns a (num_frames, num_columns) float32 array.
+    Iterating over the store yields (label, sample, array) in label, sample order.
+    '''
+    def __init__(self, path='data'):
+        self.path = path
+        self.columns = []
+        self.index = {}
+        with open(os.path.join(path, INDEX_FILE)) as f:
+            for line_idx, line in enumerate(f):
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # a partially written last line, from an interrupted append
+                    continue
+                if line_idx == 0:
+                    self.columns = entry['columns']
+                else:
+                    self.index[(entry['label'], entry['sample'])] = (entry['offset'], entry['length'])
+
+        num_rows = os.path.getsize(os.path.join(path, DATA_FILE)) // (DTYPE().itemsize * len(self.columns))
+        if num_rows:
+            self.data = np.memmap(os.path.join(path, DATA_FILE), dtype=DTYPE, mode='r',
+                                  shape=(num_rows, len(self.columns)))
+        else:
+            self.data = np.empty((0, len(self.columns)), dtype=DTYPE)
+
+    def labels(self):
+        return sorted(set(label for label, _ in self.index))
+
+    def samples(self, label):
+        return sorted(sample for l, sample in self.index if l == label)
+
+    def get(self, label, sample):
+        offset, length = self.index[(label, sample)]
+        return self.data[offset:offset+length]
+
+    def __iter__(self):
+        for label, sample in sorted(self.index):
+            yield label, sample, self.get(label, sample)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, key):
+        return key in self.index
+
+
+class LandmarkStoreWriter():
+    '''
+    Appends samples to a landmark store, creating it if needed.
+    columns is required when creating a new store.
+    '''
+    def __init__(self, path='data', columns=None):
+        self.path = path
+        index_path = os.path.join(path, INDEX_FILE)
+        if os.path.exists(index_path):
+            with open(index_path) as f:
+                self.columns = json.loads(f.readline())['columns']
+            assert columns is None or list(columns) == self.columns, 'Columns do not match the existing store'
+        else:
+            assert columns is not None, 'Columns are required to create a new store'
+            self.columns = list(columns)
+            if not os.path.isdir(path):
+                os.makedirs(path)
+            # start from an empty data file, in case one was left without an index
+            open(os.path.join(path, DATA_FILE), 'wb').close()
+            _write_atomic(index_path, json.dumps({'columns': self.columns}) + '\n')
+
+    def append(self, label, sample, rows):
+        '''
+        Appends the (num_frames, num_columns) rows of a sample (array or DataFrame).
+        '''
+        rows = np.ascontiguousarray(rows, dtype=DTYPE)
+        sample_writer = self.open_sample(label, sample)
+        sample_writer.write_rows(rows.reshape(-1, len(self.columns)))
+        sample_writer.close()
+
+    def open_sample(self, label, sample):
+        '''
+        Returns a StoreSampleWriter that appends the rows of one sample as they are written.
+        '''
+        return StoreSampleWriter(self, label, sample)
+
+
+class StoreSampleWriter():
+    '''
+    Writes the rows of one sample to the end of a store's data file, one row at a time.
+    The index entry is only added by close(), once all the rows are on disk.
+    '''
+    def __init__(self, store_writer, label, sample):
+        self.store_writer = store_writer
+        self.label = label
+        self.sample = int(sample)
+        self.num_columns = len(store_writer.columns)
+        self.length = 0
+        row_bytes = DTYPE().itemsize * self.num_columns
+        self._file = open(os.path.join(store_writer.path, DATA_FILE), 'ab')
+        self._start = self._file.tell()
+        # start at a row boundary even if a previous append was cut short
+        self.offset = -(-self._file.tell() // row_bytes)
+        self._file.write(b'\0' * (self.offset * row_bytes - self._file.tell()))
+
+    def write(self, row):
+        self.write_rows(np.reshape(row, (1, -1)))
+
+    def write_rows(self, rows):
+        rows = np.ascontiguousarray(rows, dtype=DTYPE)
+        assert rows.shape[1] == self.num_columns, 'Rows do not match the store columns'
+        self._file.write(rows.tobytes())
+        self.length += len(rows)
+
+    def close(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        entry = {'label': self.label, 'sample': self.sample, 'offset': int(self.offset), 'length': self.length}
+        index_path = os.path.join(self.store_writer.path, INDEX_FILE)
+        with open(index_path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            # don't glue this entry onto a partially written line
+            newline = '' if f.read(1) == b'\n' else '\n'
+        with open(index_path, 'a') as f:
+            f.write(newline + json.dumps(entry) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def abort(self):
+        '''
+        Drops the rows written so far: the data file is cut back to where this sample started.
+        '''
+        self._file.truncate(self._start)
+        self._file.close()
+
+
+class CsvSampleWriter():
+    '''
+    Writes the rows of one sample to a data/[WORD]/[sample_idx].csv file, one row at a time,
+    in the same format as DataFrame.to_csv(index=False): empty fields for nan.
+    The rows go to a temporary file that replaces csv_path on close().
+    '''
+    def __init__(self, csv_path, columns):
+        self.path = csv_path
+        self.num_columns = len(columns)
+        self.length = 0
+        self._file = open(csv_path + '.tmp', 'w')
+        self._file.write(','.join(columns) + '\n')
+
+    def write(self, row):
+        assert len(row) == self.num_columns, 'Row does not match the csv columns'
+        self._file.write(','.join('' if value != value else repr(float(value)) for value in row) + '\n')
+        self.length += 1
+
+    def close(self):
+        self._file.close()
+        os.replace(self.path + '.tmp', self.path)
+
+    def abort(self):
+        self._file.close()
+        os.remove(self.path + '.tmp')
+
+
+class ArraySampleWriter():
+    '''
+    Collects rows into a (num_frames, num_columns) array, growing its buffer geometrically.
+    array() returns the rows written so far.
+    '''
+    def __init__(self, num_columns, dtype=np.float64, capacity=256):
+        self.length = 0
+        self._data = np.empty((capacity, num_columns), dtype=dtype)
+
+    def write(self, row):
+        if self.length == len(self._data):
+            data = np.empty((2 * len(self._data), self._data.shape[1]), dtype=self._data.dtype)
+            data[:self.length] = self._data
+            self._data = data
+        self._data[self.length] = row
+        self.length += 1
+
+    def array(self):
+        return self._data[:self.length]
+
+    def close(self):
+        pass
+
+    def abort(self):
+        self.length = 0
+
+
+def write_rows(rows, *writers):
+    '''
+    Writes an iterable of rows (e.g. utils.iter_video_landmarks) to every writer as the rows
+    come, then closes the writers. Returns the number of rows written.
+    If the rows fail part way (e.g. a decoding error), the writers are aborted instead and the
+    error is raised: no csv file, store rows or store index entry is left for the sample.
+    '''
+    length = 0
+    done = False
+    try:
+        for row in rows:
+            for writer in writers:
+                writer.write(row)
+            length += 1
+        done = True
+    finally:
+        for writer in writers:
+            if done:
+                writer.close()
+            else:
+                writer.abort()
+    return length
+
+def store_exists(path='data'):
+    return os.path.exists(os.path.join(path, INDEX_FILE))
+
+def _write_atomic(path, text):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def read_csv_sample(csv_path):
+    '''
+    Reads a data/[WORD]/[sample_idx].csv file without pandas.
+    Returns the column names and a (num_frames, num_columns) float32 array.
+    '''
+    with open(csv_path) as f:
+        columns = f.readline().strip().split(',')
+        # empty fields (hands or pose not detected) are read as nan
+        rows = np.genfromtxt(f, delimiter=',', dtype=DTYPE)
+    return columns, rows.reshape(-1, len(columns))
+
+def convert_csv_tree(data_dir='data', out_dir=None):
+    '''
+    Converts every data/[WORD]/[sample_idx].csv into a new landmark store in out_dir
+    (data_dir by default), replacing any existing store there.
+    '''
+    out_dir = out_dir or data_dir
+    samples = []
+    for word in sorted(os.listdir(data_dir)):
+        word_dir = os.path.join(data_dir, word)
+        if not os.path.isdir(word_dir):
+            continue
+        for file in os.listdir(word_dir):
+            name, ext = os.path.splitext(file)
+            if ext == '.csv' and name.isdigit():
+                samples.append((word, int(name), os.path.join(word_dir, file)))
+    samples.sort()
+
+    # Build the store under temporary names, then swap it in
+    tmp_dir = os.path.join(out_dir, '.store_tmp')
+    if os.path.isdir(tmp_dir):
+        for file in os.listdir(tmp_dir):
+            os.remove(os.path.join(tmp_dir, file))
+    writer = None
+    for word, sample, csv_path in samples:
+        columns, rows = read_csv_sample(csv_path)
+        if writer is None:
+            writer = LandmarkStoreWriter(tmp_dir, columns=columns)
+        writer.append(word, sample, rows)
+    if writer is None:
+        print('No samples found in', data_dir)
+        return
+    os.replace(os.path.join(tmp_dir, DATA_FILE), os.path.join(out_dir, DATA_FILE))
+    os.replace(os.path.join(tmp_dir, INDEX_FILE), os.path.join(out_dir, INDEX_FILE))
+    os.rmdir(tmp_dir)
+    print('Converted {} samples into {}'.format(len(samples), os.path.join(out_dir, DATA_FILE)))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == 'convert':
+        convert_csv_tree(*sys.argv[2:4])
+    else:
+        print('usage: python dataset_store.py convert [data_dir] [out_dir]')
@@ -0,0 +1,170 @@
+'''
+Evaluation of the recognition model on the pre-recorded test videos (test_webcam_data/).
+
+Evaluating runs in two steps:
+1. Landmarks: every test video is run through MediaPipe once, on a pool of processes, and its
+   landmark rows (see utils.COLUMNS) are cached in eval_cache/ as .npy files. The cache key is
+   a hash of the video's content and of the MediaPipe settings, so a cached video is only
+   processed again when the video or the settings change.
+2. Replay: the cached rows go through the same steps as VideoHandler.process_frame (sliding
+   window features, classifier, threshold), with the classifier run once per video on all
+   the windows. Evaluating a new classifier only repeats this step.
+
+python evaluation.py -j 4 [--model saved_model.npz]
+'''
+import os
+import json
+import string
+import hashlib
+import argparse
+import multiprocessing
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import cv2
+import numpy as np
+import mediapipe as mp
+from utils import LandmarkExtractor, SlidingWindowFeatures, extract_landmarks, file_hash, model_labels, HAND_DETECTED_COLS, NUM_COLUMNS
+from model_registry import get_model, DEFAULT_MODEL
+
+CACHE_DIR = 'eval_cache'
+# Bump when the layout of the cached rows changes
+CACHE_VERSION = 1
+
+
+def cache_key(video_path, settings):
+    '''
+    Hash of the video content, the MediaPipe version and settings, and the row layout.
+    '''
+    key = {'video': file_hash(video_path), 'mediapipe': mp.__version__,
+           'settings': settings, 'version': CACHE_VERSION}
+    return hashlib.sha1(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+def extract_video_landmarks(video_path, settings):
+    '''
+    Worker job: returns the (num_frames, NUM_COLUMNS) float32 landmark rows of a video,
+    with NaN hand columns on frames without hands.
+    '''
+    extractor = LandmarkExtractor(**settings)
+    cap = cv2.VideoCapture(video_path)
+    rows = []
+    try:
+        while cap.isOpened():
+            success, image = cap.read()
+            if not success:
+                break
+            hand_result, pose_result = extractor.process(image)
+            rows.append(extract_landmarks(hand_result, pose_result, cap.get(cv2.CAP_PROP_POS_MSEC)))
+    finally:
+        cap.release()
+        extractor.close()
+    return np.array(rows, dtype=np.float32).reshape(-1, NUM_COLUMNS)
+
+def load_landmarks(video_paths, settings, workers=None, cache_dir=CACHE_DIR, use_cache=True):
+    '''
+    Returns {video_path: landmark rows}, from the cache where possible.
+    Videos that aren't cached are processed in parallel by a pool of worker processes.
+    '''
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    landmarks = {}
+    missing = {}
+    for video_path in video_paths:
+        cache_path = os.path.join(cache_dir, cache_key(video_path, settings) + '.npy')
+        if use_cache and os.path.exists(cache_path):
+            landmarks[video_path] = np.load(cache_path)
+        else:
+            missing[video_path] = cache_path
+
+    if missing:
+        print('Extracting landmarks from {} videos...'.format(len(missing)))
+        # spawn, so that no MediaPipe graph state is shared with the parent through fork
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            futures = {pool.submit(extract_video_landmarks, video_path, settings): video_path
+                       for video_path in missing}
+            for future in as_completed(futures):
+                video_path = futures[future]
+                rows = landmarks[video_path] = future.result()
+                # write under a temporary name, so an interrupted run leaves no partial file
+                tmp_path = missing[video_path] + '.tmp.npy'
+                np.save(tmp_path, rows)
+                os.replace(tmp_path, missing[video_path])
+    return landmarks
+
+def replay(rows, model, buffer_size=10, pred_thresh=0.7):
+    '''
+    Returns the prediction after every frame, as VideoHandler.process_frame would make them
+    from these landmark rows: 'No hands detected', 'Neutral', or a class label.
+    '''
+    processor = SlidingWindowFeatures(buffer_size)
+    has_hands = ~np.isnan(rows[:, HAND_DETECTED_COLS]).all(axis=1)
+    windows = []
+    window_frames = []
+    for frame_idx, row in enumerate(rows):
+        if not has_hands[frame_idx]:
+            processor.reset()
+            continue
+        processor.push(row)
+        if len(processor) == buffer_size:
+            windows.append(processor.features())
+            window_frames.append(frame_idx)
+
+    # one classifier call for the whole video
+    window_preds = {}
+    labels = model_labels(model)
+    if windows:
+        probs = model.predict_proba(np.array(windows))
+        for frame_idx, prob in zip(window_frames, probs):
+            pred_class = prob.argmax()
+            window_preds[frame_idx] = 'Neutral' if prob[pred_class] < pred_thresh else labels[pred_class]
+
+    preds = []
+    prediction = 'Neutral'
+    for frame_idx in range(len(rows)):
+        if not has_hands[frame_idx]:
+            prediction = 'No hands detected'
+        else:
+            prediction = window_preds.get(frame_idx, prediction)
+        preds.append(prediction)
+    return preds
+
+def evaluate(model=None, letters=string.ascii_uppercase, workers=None, buffer_size=10, pred_thresh=0.7,
+             pose_stride=0, inference_width=None, hand_roi=False, use_cache=True, verbose=True):
+    '''
+    Evaluates a model (default: the saved model) on test_webcam_data/[LETTER].mp4.
+    Each video's prediction is the most frequent letter predicted on its frames.
+    Returns {letter: predicted letter or None}.
+    '''
+    from video_handler import ensure_test_data
+    ensure_test_data()
+    if model is None or isinstance(model, str):
+        model = get_model(model or DEFAULT_MODEL)
+    # The features don't use the pose, so it is not tracked unless asked for
+    settings = {'num_hands': 1, 'pose_stride': pose_stride, 'inference_width': inference_width,
+                'hand_roi': hand_roi}
+    video_paths = {letter: 'test_webcam_data/{}.mp4'.format(letter) for letter in letters}
+    landmarks = load_landmarks(list(video_paths.values()), settings, workers, use_cache=use_cache)
+
+    results = {}
+    for letter, video_path in video_paths.items():
+        preds = [pred.replace('LETTER-', '') for pred in replay(landmarks[video_path], model, buffer_size, pred_thresh)
+                 if pred not in ('Neutral', 'No hands detected')]
+        results[letter] = Counter(preds).most_common(1)[0][0] if preds else None
+        if verbose:
+            print('input: {}  prediction: {}  {}'.format(letter, results[letter],
+                                                        'CORRECT' if results[letter] == letter else 'INCORRECT'))
+    accuracy = sum(letter == pred for letter, pred in results.items())
+    if verbose:
+        print('\n\nFinal Accuracy: {}/{} ({}%)'.format(accuracy, len(results), round(accuracy/len(results), 2)))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-j', '--workers', type=int, default=None,
+                        help='number of processes to extract landmarks with (default: number of cpus)')
+    parser.add_argument('--model', default=None, help='saved model to evaluate (default: {})'.format(DEFAULT_MODEL))
+    parser.add_argument('--letters', default=string.ascii_uppercase, help='letters to test (default: all)')
+    parser.add_argument('--no-cache', action='store_true', help='extract the landmarks again even if cached')
+    args = parser.parse_args()
+    evaluate(args.model, args.letters.upper(), args.workers, use_cache=not args.no_cache)
@@ -0,0 +1,51 @@
+'''
+Frame helpers that only need OpenCV and NumPy, so that modules like guide_video.py can use
+them without loading MediaPipe. utils.py imports them too.
+'''
+import cv2
+import numpy as np
+
+
+def resize_to_width(image, width):
+    '''
+    Downscales image so that it is at most width pixels wide, keeping the aspect ratio.
+    '''
+    if width is None or image.shape[1] <= width:
+        return image
+    height = max(1, round(image.shape[0] * width / image.shape[1]))
+    return cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+
+def reuse_buffer(buf, shape, dtype=np.uint8):
+    '''
+    Returns buf if it is an array of the given shape and dtype, or a new empty one to use instead.
+    '''
+    if buf is None or buf.shape != shape or buf.dtype != dtype:
+        buf = np.empty(shape, dtype=dtype)
+    buf.flags.writeable = True
+    return buf
+
+class FrameRing():
+    '''
+    A few preallocated frames, handed out in turn, so per-frame image operations can write into
+    them (dst=) instead of allocating. A frame is only overwritten size calls later,
+    so size must cover every frame still in use (e.g. being displayed, or queued for display).
+    Frames passed as in_use are skipped, and if all of them are in use a new frame is returned.
+    '''
+    def __init__(self, size=3):
+        self.buffers = [None] * size
+        self.idx = 0
+
+    def next(self, shape, dtype=np.uint8, in_use=()):
+        for _ in range(len(self.buffers)):
+            idx = self.idx
+            self.idx = (self.idx + 1) % len(self.buffers)
+            if not any(self.buffers[idx] is frame for frame in in_use):
+                buf = self.buffers[idx] = reuse_buffer(self.buffers[idx], shape, dtype)
+                return buf
+        return np.empty(shape, dtype=dtype)
+
+def mirror(image, out=None):
+    '''
+    Flips image around the y-axis, into out if given.
+    '''
+    return cv2.flip(image, 1, dst=reuse_buffer(out, image.shape, image.dtype) if out is not None else None)
@@ -0,0 +1,197 @@
+'''
+Guide video playback from a cache of decoded clips.
+
+The first time a guide clip is played, its frames are decoded one by one as they are shown,
+downscaled to the display width and kept in memory. Playing the same clip again (replays,
+or switching back to a letter shown earlier) then needs no decoding at all, apart from
+frames that were skipped the first time.
+
+Playback follows the clip's own frame rate on a monotonic clock, not the UI frame rate:
+when the UI is faster than the clip the current frame is held, and when it is slower the
+frames that would be dropped are skipped with grab(), without being decoded. Skipped frames
+are decoded when a later playback reaches them.
+Clips are shared by all the displays through one GuideClipCache, which keeps the most recently
+used clips within a byte budget and evicts the least recently used ones.
+'''
+import time
+import threading
+from collections import OrderedDict
+import cv2
+from frame_utils import resize_to_width
+import profiling
+
+# Memory budget for decoded guide frames, shared by all guide displays
+GUIDE_CACHE_MB = 256
+# When filling a skipped frame, read on to it if it is at most this many frames ahead, else seek
+FILL_READ_AHEAD = 30
+
+
+class GuideClip():
+    '''
+    The frames of one video, decoded on demand and kept once decoded.
+    frame(idx) decodes up to idx if needed and returns None past the end of the clip.
+    Frames that were skipped on the way to idx are not decoded and are stored as None (holes).
+    When a later playback asks for a hole, it is decoded then from a second capture, which
+    reads forward or seeks to it, so a clip only stays incomplete until it is played again.
+    '''
+    def __init__(self, path, width=None):
+        self.path = path
+        self.width = width
+        self.frames = []
+        self.nbytes = 0
+        self.holes = 0
+        self.complete = False
+        self._cap = cv2.VideoCapture(path)
+        self._fill_cap = None
+        self.fps = self._cap.get(cv2.CAP_PROP_FPS) or 30.
+        self._lock = threading.Lock()
+
+    def frame(self, idx):
+        with self._lock:
+            while idx >= len(self.frames) and not self.complete:
+                if len(self.frames) < idx:
+                    # skipped frame: advance the decoder without converting the frame
+                    success, frame = self._cap.grab(), None
+                else:
+                    success, frame = self._cap.read()
+                if not success:
+                    self._finish()
+                    break
+                if frame is None:
+                    self.holes += 1
+                else:
+                    frame = resize_to_width(frame, self.width)
+                    self.nbytes += frame.nbytes
+                self.frames.append(frame)
+            if idx >= len(self.frames):
+                return None
+            if self.frames[idx] is None:
+                self._fill(idx)
+            while idx > 0 and self.frames[idx] is None:
+                idx -= 1
+            return self.frames[idx]
+
+    def _fill(self, idx):
+        '''
+        Decodes the skipped frame idx into its hole.
+        '''
+        if self._fill_cap is None:
+            self._fill_cap = cv2.VideoCapture(self.path)
+        pos = int(self._fill_cap.get(cv2.CAP_PROP_POS_FRAMES))
+        if pos <= idx <= pos + FILL_READ_AHEAD:
+            # close ahead: reading on is cheaper than seeking
+            success = all(self._fill_cap.grab() for _ in range(idx - pos))
+        else:
+            success = self._fill_cap.set(cv2.CAP_PROP_POS_FRAMES, idx)
+        success, frame = self._fill_cap.read() if success else (False, None)
+        if not success:
+            # leave the hole, the previous frame is shown instead
+            return
+        self.frames[idx] = frame = resize_to_width(frame, self.width)
+        self.nbytes += frame.nbytes
+        self.holes -= 1
+        if self.holes == 0 and self.complete:
+            self._fill_cap.release()
+            self._fill_cap = None
+
+    def _finish(self):
+        self.complete = True
+        self._cap.release()
+        if self.holes == 0 and self._fill_cap is not None:
+            self._fill_cap.release()
+            self._fill_cap = None
+
+
+class GuideClipCache():
+    '''
+    LRU cache of GuideClips, keyed by (path, width), holding at most max_bytes of decoded frames.
+    A clip that is still being decoded counts with the frames decoded so far.
+    '''
+    def __init__(self, max_bytes=GUIDE_CACHE_MB * 2**20):
+        self.max_bytes = max_bytes
+        self.clips = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, path, width=None):
+        key = (path, width)
+        with self._lock:
+            clip = self.clips.get(key)
+            if clip is not None:
+                self.clips.move_to_end(key)
+                self.hits += 1
+                return clip
+            self.misses += 1
+            clip = self.clips[key] = GuideClip(path, width)
+            self._evict()
+            return clip
+
+    def trim(self):
+        '''
+        Evicts least recently used clips until the cache is within budget.
+        '''
+        with self._lock:
+            self._evict()
+
+    def _evict(self):
+        # The most recently used clip is never evicted. Evicted clips are only dropped from
+        # the cache: a display still playing one keeps it until it loads another source.
+        while len(self.clips) > 1 and self.nbytes() > self.max_bytes:
+            self.clips.popitem(last=False)
+
+    def nbytes(self):
+        return sum(clip.nbytes for clip in self.clips.values())
+
+    def clear(self):
+        with self._lock:
+            self.clips.clear()
+
+
+_cache = None
+
+def get_clip_cache():
+    '''
+    Returns the GuideClipCache shared by all guide displays.
+    '''
+    global _cache
+    if _cache is None:
+        _cache = GuideClipCache()
+    return _cache
+
+
+class GuidePlayer():
+    '''
+    Plays a guide clip from the shared cache at the clip's native fps.
+    Has the same load_source/get_frame interface as VideoHandler.
+    get_frame returns the frame due at the current time, which is the same array as on the
+    previous call if the clip hasn't moved on yet, or None once the clip has ended.
+    The clock starts on the first get_frame call after load_source.
+    '''
+    def __init__(self, vid_src, width=None, cache=None):
+        self.width = width
+        self.cache = cache or get_clip_cache()
+        self.shown = 0
+        self.dropped = 0
+        self.load_source(vid_src)
+
+    def load_source(self, vid_src):
+        self.clip = self.cache.get(vid_src, self.width)
+        self.frame_idx = -1
+        self.start_time = None
+
+    def get_frame(self):
+        now = time.monotonic()
+        if self.start_time is None:
+            self.start_time = now
+        idx = int((now - self.start_time) * self.clip.fps)
+        with profiling.timer('guide_read'):
+            frame = self.clip.frame(idx)
+        if frame is not None and idx > self.frame_idx:
+            self.shown += 1
+            self.dropped += idx - self.frame_idx - 1
+            self.frame_idx = idx
+            # the clip may have grown (new frames or filled holes): keep the cache within budget
+            if not self.clip.complete or self.clip.holes:
+                self.cache.trim()
+        return frame
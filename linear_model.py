@@ -0,0 +1,68 @@
+'''
+Closed-form inference for the LinearDiscriminantAnalysis recognition model.
+
+The fitted sklearn model is exported once to plain NumPy weights (saved_model.npz),
+and LinearModel computes the same probabilities as sklearn's predict_proba
+with one matrix product and a softmax, without importing sklearn.
+'''
+import sys
+import numpy as np
+
+
+class LinearModel():
+    '''
+    A linear classifier: scores = X @ coef.T + intercept, probabilities = softmax(scores).
+    Has the same predict_proba interface as the sklearn model it was exported from.
+    labels[i] is the word of class i.
+    '''
+    def __init__(self, coef, intercept, labels):
+        self.coef_T = np.ascontiguousarray(np.asarray(coef, dtype=np.float64).T)
+        self.intercept = np.asarray(intercept, dtype=np.float64)
+        self.labels = np.asarray(labels)
+        self.n_features_in_ = self.coef_T.shape[0]
+
+    @classmethod
+    def load(cls, path='saved_model.npz'):
+        weights = np.load(path)
+        return cls(weights['coef'], weights['intercept'], weights['labels'])
+
+    def predict_proba(self, X):
+        scores = np.asarray(X, dtype=np.float64) @ self.coef_T + self.intercept
+        if self.coef_T.shape[1] == 1:
+            # binary models have a single decision function
+            prob = 1. / (1. + np.exp(-scores))
+            return np.hstack([1 - prob, prob])
+        scores -= scores.max(axis=1, keepdims=True)
+        np.exp(scores, out=scores)
+        scores /= scores.sum(axis=1, keepdims=True)
+        return scores
+
+    def predict_label(self, x):
+        '''
+        Classifies a single feature vector and returns (label, probability).
+        '''
+        prob = self.predict_proba(x[np.newaxis])[0]
+        pred_class = prob.argmax()
+        return self.labels[pred_class], prob[pred_class]
+
+
+def export_model(model, path='saved_model.npz'):
+    '''
+    Saves the weights of a fitted sklearn linear model (e.g. LinearDiscriminantAnalysis)
+    trained on the class indices of utils.class_labels.
+    '''
+    from utils import class_labels
+    labels = [class_labels[c] for c in model.classes_]
+    np.savez(path, coef=model.coef_, intercept=model.intercept_, labels=np.array(labels))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == 'export':
+        import pickle
+        src = sys.argv[2] if len(sys.argv) > 2 else 'saved_model.pkl'
+        dst = sys.argv[3] if len(sys.argv) > 3 else 'saved_model.npz'
+        with open(src, 'rb') as f:
+            export_model(pickle.load(f), dst)
+        print('Exported {} to {}'.format(src, dst))
+    else:
+        print('usage: python linear_model.py export [saved_model.pkl] [saved_model.npz]')
@@ -0,0 +1,66 @@
+'''
+Loads each saved model once and shares it between all the handlers that use it.
+Models are loaded on first use, or ahead of time with warm_up().
+.npz models are exported weights run by linear_model.LinearModel (no sklearn needed),
+anything else is unpickled.
+'''
+import os
+import time
+import pickle
+import threading
+import numpy as np
+from linear_model import LinearModel
+
+# Prefer the exported weights, fall back to the pickled sklearn model
+DEFAULT_MODEL = 'saved_model.npz' if os.path.exists('saved_model.npz') else 'saved_model.pkl'
+
+_models = {}
+_timings = {}
+_lock = threading.Lock()
+
+
+def get_model(path=DEFAULT_MODEL):
+    '''
+    Returns the model saved at path, loading it on first use.
+    Safe to call from several threads: the model is only loaded once.
+    '''
+    model = _models.get(path)
+    if model is None:
+        with _lock:
+            model = _models.get(path)
+            if model is None:
+                start = time.perf_counter()
+                if path.endswith('.npz'):
+                    model = LinearModel.load(path)
+                else:
+                    with open(path, 'rb') as f:
+                        model = pickle.load(f)
+                _timings.setdefault(path, {})['load'] = time.perf_counter() - start
+                _models[path] = model
+    return model
+
+def warm_up(path=DEFAULT_MODEL, background=True):
+    '''
+    Loads the model and runs a dummy prediction, so the first real prediction isn't slow.
+    With background=True this happens on a daemon thread, which is returned.
+    '''
+    def run():
+        model = get_model(path)
+        num_features = getattr(model, 'n_features_in_', 126)
+        start = time.perf_counter()
+        model.predict_proba(np.zeros((1, num_features)))
+        _timings[path]['warm_up'] = time.perf_counter() - start
+        print('Model {} loaded in {:.3f}s, warmed up in {:.3f}s'.format(
+            path, _timings[path]['load'], _timings[path]['warm_up']))
+
+    if background:
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread
+    run()
+
+def get_timings(path=DEFAULT_MODEL):
+    '''
+    Returns the load and warm-up times (in seconds) measured so far for a model.
+    '''
+    return dict(_timings.get(path, {}))
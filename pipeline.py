@@ -0,0 +1,181 @@
+import threading
+import time
+from collections import deque
+
+
+DROP_POLICIES = ('oldest', 'newest', 'block')
+
+class FrameQueue():
+    '''
+    A bounded, thread-safe queue for passing frames between pipeline stages.
+    When the queue is full, drop_policy decides what happens to a new item:
+    - 'oldest': the oldest queued item is dropped to make room (lowest latency)
+    - 'newest': the new item is dropped
+    - 'block': the producer waits until there is room
+    '''
+    def __init__(self, maxsize=2, drop_policy='oldest'):
+        assert maxsize > 0, 'Queue size must be a positive number'
+        assert drop_policy in DROP_POLICIES, 'Drop policy must be one of {}'.format(DROP_POLICIES)
+        self.maxsize = maxsize
+        self.drop_policy = drop_policy
+        self.dropped = 0
+        self._items = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def put(self, item):
+        with self._cond:
+            while len(self._items) >= self.maxsize:
+                if self.drop_policy == 'oldest':
+                    self._items.popleft()
+                    self.dropped += 1
+                elif self.drop_policy == 'newest':
+                    self.dropped += 1
+                    return False
+                else:
+                    if self._closed:
+                        return False
+                    self._cond.wait(0.1)
+            self._items.append(item)
+            self._cond.notify_all()
+            return True
+
+    def get(self, timeout=None):
+        '''
+        Returns the oldest item, or None if nothing arrived within timeout.
+        '''
+        with self._cond:
+            if not self._items and not self._closed:
+                self._cond.wait(timeout)
+            if not self._items:
+                return None
+            item = self._items.popleft()
+            self._cond.notify_all()
+            return item
+
+    def get_newest(self):
+        '''
+        Drains the queue and returns the newest item, or None if it is empty.
+        '''
+        with self._cond:
+            if not self._items:
+                return None
+            item = self._items.pop()
+            self._items.clear()
+            self._cond.notify_all()
+            return item
+
+    def items(self):
+        '''
+        Returns the queued items, oldest first, without removing them.
+        '''
+        with self._cond:
+            return list(self._items)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def __len__(self):
+        return len(self._items)
+
+
+class RecognitionPipeline():
+    '''
+    Runs capture and recognition for a VideoHandler on two background threads
+    so that the UI thread never waits on the camera, MediaPipe, or the model.
+
+    capture thread:     handler.read_frame()     -> frames queue
+    recognition thread: handler.process_frame()  -> results queue
+
+    The UI calls get_latest() to pull the newest (image, prediction, score, timestamp, landmarks),
+    where landmarks is the handler's overlay_landmarks for that image.
+    If nobody pulls results for idle_timeout seconds (e.g. the screen owning the
+    handler is not active), capture pauses until the next pull.
+    '''
+    def __init__(self, handler, queue_size=2, drop_policy='oldest', idle_timeout=0.5):
+        self.handler = handler
+        self.frames = FrameQueue(queue_size, drop_policy)
+        # The UI only ever wants the most recent result
+        self.results = FrameQueue(1, 'oldest')
+        self.idle_timeout = idle_timeout
+        # image of the last result handed to the UI, which may still be displaying it
+        self._displayed = None
+        self._lock = threading.Lock()
+        self.finished = False
+        self._last_pull = time.monotonic()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        self._stop.clear()
+        self.finished = False
+        self._last_pull = time.monotonic()
+        self._threads = [threading.Thread(target=self._capture_loop, daemon=True),
+                         threading.Thread(target=self._recognition_loop, daemon=True)]
+        for t in self._threads:
+            t.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        self.frames.close()
+        for t in self._threads:
+            t.join()
+        self._threads = []
+        # start again from nothing: no frames or results of the previous run
+        self.frames = FrameQueue(self.frames.maxsize, self.frames.drop_policy)
+        with self._lock:
+            self.results = FrameQueue(1, 'oldest')
+            self._displayed = None
+        self.finished = False
+
+    def is_running(self):
+        return any(t.is_alive() for t in self._threads)
+
+    def get_latest(self):
+        '''
+        Returns the newest (image, prediction, score, timestamp, landmarks) produced since the last call,
+        or None if recognition has not produced anything new.
+        '''
+        self._last_pull = time.monotonic()
+        self._wake.set()
+        with self._lock:
+            item = self.results.get_newest()
+            if item is not None:
+                self._displayed = item[0]
+        return item
+
+    def frames_in_use(self):
+        '''
+        Returns the images the UI holds or may still pull: the last one handed out and the
+        queued ones. The handler must not write into them (see video_handler.FRAME_BUFFERS).
+        '''
+        with self._lock:
+            return [self._displayed] + [item[0] for item in self.results.items()]
+
+    def _capture_loop(self):
+        while not self._stop.is_set():
+            if time.monotonic() - self._last_pull > self.idle_timeout:
+                self._wake.clear()
+                self._wake.wait(self.idle_timeout)
+                continue
+            image = self.handler.read_frame()
+            if image is None:
+                self.finished = True
+                break
+            self.frames.put((image, time.monotonic()))
+        self.frames.close()
+
+    def _recognition_loop(self):
+        while not self._stop.is_set():
+            item = self.frames.get(timeout=0.1)
+            if item is None:
+                if self.finished:
+                    break
+                continue
+            image, timestamp = item
+            image, prediction, score = self.handler.process_frame(image)
+            self.results.put((image, prediction, score, timestamp, self.handler.overlay_landmarks))
@@ -0,0 +1,190 @@
+'''
+Per-stage timing of the recognition path.
+
+Each stage (reading the frame, MediaPipe, features, classification, drawing, texture upload...)
+records its durations into a fixed-size histogram with logarithmic bins, so recording costs
+the same whether the app has run for a second or a day, and percentiles can be read at any time.
+
+Profiling is off by default. While it is off, timer() returns a shared do-nothing context
+and record() returns right away, so the instrumented code pays one flag check per stage.
+Turn it on with enable(), with PROFILE below, or with the ASLINGO_PROFILE=1 environment variable.
+
+The timings can be read:
+- from code: snapshot() returns {stage: {'count', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms'}}
+- on screen: press F3 in the learning or game mode (see config.ProfilerDisplay)
+- in the log: start_logging(interval) prints log_line() every interval seconds
+'''
+import os
+import math
+import time
+import threading
+
+PROFILE = os.environ.get('ASLINGO_PROFILE', '') not in ('', '0')
+# Histogram range and resolution: 1 us to 10 s, 20 bins per decade (about 12% wide)
+MIN_US = 1.
+MAX_US = 1e7
+BINS_PER_DECADE = 20
+# Seconds between log lines when logging is on (0 to not log)
+LOG_INTERVAL = float(os.environ.get('ASLINGO_PROFILE_LOG', 0))
+
+_enabled = PROFILE
+_histograms = {}
+_lock = threading.Lock()
+
+
+class Histogram():
+    '''
+    Durations in fixed log-spaced bins between MIN_US and MAX_US (values outside are clamped).
+    Percentiles are accurate to the width of one bin.
+    '''
+    NUM_BINS = int(math.log10(MAX_US / MIN_US) * BINS_PER_DECADE) + 1
+
+    def __init__(self):
+        self.counts = [0] * self.NUM_BINS
+        self.count = 0
+        self.total = 0.
+        self.max = 0.
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        us = seconds * 1e6
+        idx = int(math.log10(us / MIN_US) * BINS_PER_DECADE) if us > MIN_US else 0
+        with self._lock:
+            self.counts[min(idx, self.NUM_BINS - 1)] += 1
+            self.count += 1
+            self.total += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    def percentile(self, p):
+        '''
+        Returns the p-th percentile in seconds (the geometric center of its bin).
+        '''
+        if not self.count:
+            return 0.
+        target = p / 100. * self.count
+        seen = 0
+        for idx, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= target:
+                break
+        return min(MIN_US * 10 ** ((idx + 0.5) / BINS_PER_DECADE) / 1e6, self.max)
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.
+
+    def reset(self):
+        with self._lock:
+            self.counts = [0] * self.NUM_BINS
+            self.count = 0
+            self.total = 0.
+            self.max = 0.
+
+
+class _NullTimer():
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+class _Timer():
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.add(time.perf_counter() - self.start)
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+
+def enable(on=True):
+    global _enabled
+    _enabled = on
+
+def is_enabled():
+    return _enabled
+
+def histogram(stage):
+    hist = _histograms.get(stage)
+    if hist is None:
+        with _lock:
+            hist = _histograms.setdefault(stage, Histogram())
+    return hist
+
+def timer(stage):
+    '''
+    Times the body of a with block as one sample of stage:
+    with profiling.timer('hands'):
+        ...
+    '''
+    if not _enabled:
+        return _NULL_TIMER
+    return _Timer(histogram(stage))
+
+def record(stage, seconds):
+    '''
+    Records a duration measured by the caller.
+    '''
+    if _enabled:
+        histogram(stage).add(seconds)
+
+def reset():
+    for hist in list(_histograms.values()):
+        hist.reset()
+
+def snapshot():
+    '''
+    Returns the statistics of every stage recorded so far, in milliseconds.
+    '''
+    stats = {}
+    for stage, hist in sorted(_histograms.items()):
+        if hist.count:
+            stats[stage] = {'count': hist.count,
+                            'mean_ms': round(hist.mean() * 1000, 3),
+                            'p50_ms': round(hist.percentile(50) * 1000, 3),
+                            'p95_ms': round(hist.percentile(95) * 1000, 3),
+                            'p99_ms': round(hist.percentile(99) * 1000, 3),
+                            'max_ms': round(hist.max * 1000, 3)}
+    return stats
+
+def format_table(stats=None):
+    '''
+    Multi-line summary, one stage per line, for the on-screen overlay.
+    '''
+    stats = snapshot() if stats is None else stats
+    if not stats:
+        return 'profiling: no samples' if _enabled else 'profiling off'
+    lines = ['{:<10} {:>7} {:>7} {:>7}'.format('stage', 'p50', 'p95', 'p99')]
+    for stage, s in stats.items():
+        lines.append('{:<10} {:>7.2f} {:>7.2f} {:>7.2f}'.format(stage, s['p50_ms'], s['p95_ms'], s['p99_ms']))
+    return '\n'.join(lines)
+
+def log_line(stats=None):
+    '''
+    One-line summary of the p50/p95 of each stage, in milliseconds.
+    '''
+    stats = snapshot() if stats is None else stats
+    return 'profile ' + ' '.join('{}={:.2f}/{:.2f}'.format(stage, s['p50_ms'], s['p95_ms'])
+                                 for stage, s in stats.items())
+
+def start_logging(interval=LOG_INTERVAL or 10.):
+    '''
+    Prints log_line() every interval seconds on a daemon thread, while profiling is on.
+    '''
+    def run():
+        while True:
+            time.sleep(interval)
+            if _enabled and _histograms:
+                print(log_line())
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,254 @@
+'''
+Headless recognition server for many learners on one machine.
+
+Every session reads frames from its own source (a video file, a camera index, or any
+iterable of BGR frames). Landmark extraction runs on a pool of worker processes that each
+own their MediaPipe graphs; a session is pinned to one worker so MediaPipe can track its
+hands from frame to frame. Everything after extraction is the app's own recognition path:
+each session has a VideoHandler without a capture, whose process_landmarks() updates the
+window features and the prediction exactly like process_frame() does in the app, with the
+classifier shared with the other sessions through a BatchPredictor.
+The extraction and threshold settings default to the app's (see video_handler.py).
+
+Fairness: a session never has more than one frame waiting for its worker, so a worker
+serves the sessions assigned to it in turn, whatever their source frame rates.
+Admission: at most max_sessions sessions run at a time.
+
+Load test with the test_webcam_data videos as simulated clients:
+python recognition_server.py --load-test 8 --workers 4
+'''
+import os
+import time
+import queue
+import string
+import argparse
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import cv2
+import numpy as np
+from utils import LandmarkExtractor, SlidingWindowFeatures, extract_landmarks
+from frame_utils import resize_to_width
+from batch_predictor import BatchPredictor
+from video_handler import VideoHandler, INFERENCE_WIDTH, HAND_ROI
+
+# Extractors of the sessions handled by this worker process, by session id
+_extractors = {}
+
+def _extract(session_id, frame, settings):
+    '''
+    Worker job: returns the landmark row of one frame of a session, or None without hands.
+    '''
+    extractor = _extractors.get(session_id)
+    if extractor is None:
+        extractor = _extractors[session_id] = LandmarkExtractor(num_hands=1, **settings)
+    hand_result, pose_result = extractor.process(frame)
+    if not hand_result.multi_handedness:
+        return
+    return extract_landmarks(hand_result, pose_result).astype(np.float32)
+
+def _close_session(session_id):
+    extractor = _extractors.pop(session_id, None)
+    if extractor:
+        extractor.close()
+
+
+class Session():
+    '''
+    One recognition stream. Predictions are put on self.predictions as
+    (frame_idx, timestamp, prediction, score) tuples, followed by None when the source ends.
+    '''
+    def __init__(self, session_id, source, worker_idx, realtime=False):
+        self.id = session_id
+        self.source = source
+        self.worker_idx = worker_idx
+        self.realtime = realtime
+        self.predictions = queue.Queue()
+        self.prediction = 'No hands detected'
+        self.score = ''
+        self.frames = 0
+        self.dropped = 0
+        self.latencies = []  # seconds from reading a frame to having its landmarks
+        self.finished = threading.Event()
+        self.thread = None
+
+    def frames_from_source(self):
+        '''
+        Yields (frame_idx, frame) from the source. With realtime=True, video files are played
+        at their native fps and frames the session fell behind on are skipped without decoding.
+        '''
+        if not isinstance(self.source, (int, str)):
+            for frame_idx, frame in enumerate(self.source):
+                yield frame_idx, frame
+            return
+
+        cap = cv2.VideoCapture(self.source)
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30.
+        start = time.monotonic()
+        frame_idx = 0
+        try:
+            while cap.isOpened() and not self.finished.is_set():
+                if self.realtime and isinstance(self.source, str):
+                    due = int((time.monotonic() - start) * fps)
+                    while frame_idx < due:
+                        if not cap.grab():
+                            return
+                        frame_idx += 1
+                        self.dropped += 1
+                    if frame_idx > due:
+                        time.sleep((frame_idx - due) / fps)
+                success, frame = cap.read()
+                if not success:
+                    return
+                yield frame_idx, frame
+                frame_idx += 1
+        finally:
+            cap.release()
+
+    def stream(self, timeout=None):
+        '''
+        Yields the predictions of this session until its source ends.
+        '''
+        while True:
+            item = self.predictions.get(timeout=timeout)
+            if item is None:
+                return
+            yield item
+
+    def stop(self):
+        self.finished.set()
+
+
+class RecognitionServer():
+    '''
+    pose_stride defaults to 0 rather than the app's POSE_STRIDE: the app only tracks the pose
+    to draw it, and the features don't use it, so the predictions are the same without it.
+    '''
+    def __init__(self, num_workers=None, max_sessions=8, buffer_size=10, pred_thresh=0.7,
+                 inference_width=INFERENCE_WIDTH, pose_stride=None, hand_roi=HAND_ROI,
+                 max_batch=32, max_wait_ms=5.):
+        self.num_workers = num_workers or os.cpu_count()
+        self.max_sessions = max_sessions
+        self.buffer_size = buffer_size
+        self.pred_thresh = pred_thresh
+        self.inference_width = inference_width
+        if pose_stride is None:
+            pose_stride = 1 if SlidingWindowFeatures.uses_pose else 0
+        # frames are downscaled before being sent to the workers, so they don't do it again
+        self.settings = {'pose_stride': pose_stride, 'hand_roi': hand_roi}
+        # one process per worker, so that sessions can be pinned to a worker
+        context = multiprocessing.get_context('spawn')
+        self.workers = [ProcessPoolExecutor(max_workers=1, mp_context=context) for _ in range(self.num_workers)]
+        self.predictor = BatchPredictor(max_batch=max_batch, max_wait_ms=max_wait_ms)
+        self.sessions = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def add_session(self, source, realtime=False):
+        '''
+        Starts recognizing a new source. Returns the Session, or None if the server is full.
+        '''
+        with self._lock:
+            if len(self.sessions) >= self.max_sessions:
+                print('Server full ({} sessions), session not admitted'.format(self.max_sessions))
+                return
+            # pin to the worker with the fewest sessions
+            load = [0] * self.num_workers
+            for session in self.sessions.values():
+                load[session.worker_idx] += 1
+            session = Session(self._next_id, source, load.index(min(load)), realtime)
+            self._next_id += 1
+            self.sessions[session.id] = session
+        session.thread = threading.Thread(target=self._run_session, args=(session,), daemon=True)
+        session.thread.start()
+        return session
+
+    def remove_session(self, session):
+        session.stop()
+        session.thread.join()
+
+    def _run_session(self, session):
+        worker = self.workers[session.worker_idx]
+        handler = VideoHandler(None, buffer_size=self.buffer_size, predictor=self.predictor)
+        handler.pred_thresh = self.pred_thresh
+        try:
+            for frame_idx, frame in session.frames_from_source():
+                if session.finished.is_set():
+                    break
+                read_time = time.monotonic()
+                frame = resize_to_width(frame, self.inference_width)
+                # wait for this frame before reading the next one: one frame in flight per session
+                row = worker.submit(_extract, session.id, frame, self.settings).result()
+                session.latencies.append(time.monotonic() - read_time)
+                session.frames += 1
+
+                # as in the app, a prediction is applied when its batch is done, so it may show
+                # up on a later frame
+                session.prediction, session.score = handler.process_landmarks(row)
+                session.predictions.put((frame_idx, read_time, session.prediction, session.score))
+        finally:
+            worker.submit(_close_session, session.id)
+            session.finished.set()
+            session.predictions.put(None)
+            with self._lock:
+                self.sessions.pop(session.id, None)
+
+    def shutdown(self):
+        for session in list(self.sessions.values()):
+            self.remove_session(session)
+        self.predictor.close()
+        for worker in self.workers:
+            worker.shutdown()
+
+
+def load_test(num_clients, num_workers=None, max_sessions=None, realtime=False):
+    '''
+    Runs num_clients simulated clients, each replaying a test_webcam_data video,
+    and prints per-session and overall throughput, latency and accuracy.
+    '''
+    from video_handler import ensure_test_data
+    ensure_test_data()
+
+    server = RecognitionServer(num_workers=num_workers, max_sessions=max_sessions or num_clients)
+    letters = [string.ascii_uppercase[i % 26] for i in range(num_clients)]
+    start = time.monotonic()
+    sessions = [(letter, server.add_session('test_webcam_data/{}.mp4'.format(letter), realtime=realtime))
+                for letter in letters]
+    results = []
+    for letter, session in sessions:
+        if session is None:
+            continue
+        preds = [pred.replace('LETTER-', '') for _, _, pred, _ in session.stream()
+                 if pred not in ('Neutral', 'No hands detected')]
+        final_pred = max(set(preds), key=preds.count) if preds else None
+        results.append((letter, session, final_pred))
+    elapsed = time.monotonic() - start
+    server.shutdown()
+
+    latencies = np.concatenate([session.latencies for _, session, _ in results]) * 1000
+    total_frames = sum(session.frames for _, session, _ in results)
+    for letter, session, final_pred in results:
+        print('session {:3d} ({}): {:5d} frames, {:4d} dropped, {:6.1f} fps, prediction {}'.format(
+            session.id, letter, session.frames, session.dropped,
+            session.frames / elapsed, final_pred))
+    correct = sum(letter == final_pred for letter, _, final_pred in results)
+    print('\n{} sessions on {} workers: {:.1f} frames/s total in {:.1f}s'.format(
+        len(results), server.num_workers, total_frames / elapsed, elapsed))
+    print('frame latency p50 {:.1f} ms, p95 {:.1f} ms'.format(
+        np.percentile(latencies, 50), np.percentile(latencies, 95)))
+    print('accuracy {}/{}, mean prediction batch {:.1f}'.format(
+        correct, len(results), server.predictor.mean_batch_size()))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--load-test', type=int, metavar='N', default=8,
+                        help='number of simulated clients (default: 8)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='number of worker processes (default: number of cpus)')
+    parser.add_argument('--max-sessions', type=int, default=None,
+                        help='admission limit (default: number of clients)')
+    parser.add_argument('--realtime', action='store_true',
+                        help='play the videos at their native fps instead of as fast as possible')
+    args = parser.parse_args()
+    load_test(args.load_test, args.workers, args.max_sessions, args.realtime)
@@ -0,0 +1,84 @@
+import time
+from collections import deque
+
+
+FULL = 'full'            # run MediaPipe and the classifier
+LANDMARKS = 'landmarks'  # run MediaPipe, keep the previous prediction
+REUSE = 'reuse'          # reuse the previous landmarks and prediction, only draw the frame
+DECISIONS = (FULL, LANDMARKS, REUSE)
+STAGES = ('landmarks', 'classify', 'annotate')
+
+class AdaptiveScheduler():
+    '''
+    Decides, for every frame, how much of the recognition path to run so that
+    processing a frame stays within budget_ms on average.
+
+    The cost of each stage is tracked with an exponential moving average (smoothing).
+    Time spent over budget is carried over as debt and paid back by cheaper frames.
+    No more than max_reuse frames in a row reuse old landmarks, and the classifier
+    runs at least every max_skip_classify frames, so predictions never go stale.
+    '''
+    def __init__(self, budget_ms=33., smoothing=0.1, max_reuse=2, max_skip_classify=5, fps_window=60):
+        assert budget_ms > 0, 'Latency budget must be a positive number'
+        self.budget_ms = budget_ms
+        self.smoothing = smoothing
+        self.max_reuse = max_reuse
+        self.max_skip_classify = max_skip_classify
+        self.cost_ms = {stage: None for stage in STAGES}
+        self.counts = {decision: 0 for decision in DECISIONS}
+        self.debt_ms = 0.
+        self._reuse_streak = 0
+        self._since_classify = 0
+        self._frame_times = deque(maxlen=fps_window)
+        self._last_frame_ms = 0.
+
+    def decide(self):
+        self._frame_times.append(time.monotonic())
+        land, cls, ann = (self.cost_ms[stage] for stage in STAGES)
+        if land is None or cls is None:
+            # measure every stage at least once
+            decision = FULL
+        else:
+            available = self.budget_ms - (ann or 0.) - self.debt_ms
+            if available >= land + cls or self._since_classify >= self.max_skip_classify:
+                decision = FULL
+            elif available >= land or self._reuse_streak >= self.max_reuse:
+                decision = LANDMARKS
+            else:
+                decision = REUSE
+
+        self._reuse_streak = self._reuse_streak + 1 if decision == REUSE else 0
+        self._since_classify = 0 if decision == FULL else self._since_classify + 1
+        self.counts[decision] += 1
+        return decision
+
+    def record(self, stage, seconds):
+        '''
+        Records how long a stage took on this frame.
+        '''
+        ms = seconds * 1000
+        prev = self.cost_ms[stage]
+        self.cost_ms[stage] = ms if prev is None else prev + self.smoothing * (ms - prev)
+
+    def frame_done(self, seconds):
+        '''
+        Records the total processing time of a frame and updates the debt.
+        '''
+        self._last_frame_ms = seconds * 1000
+        self.debt_ms = max(0., self.debt_ms + self._last_frame_ms - self.budget_ms)
+
+    def fps(self):
+        if len(self._frame_times) < 2:
+            return 0.
+        elapsed = self._frame_times[-1] - self._frame_times[0]
+        return (len(self._frame_times) - 1) / elapsed if elapsed > 0 else 0.
+
+    def metrics(self):
+        total = sum(self.counts.values())
+        return {'budget_ms': self.budget_ms,
+                'fps': round(self.fps(), 1),
+                'last_frame_ms': round(self._last_frame_ms, 2),
+                'debt_ms': round(self.debt_ms, 2),
+                'stage_ms': {stage: None if ms is None else round(ms, 2) for stage, ms in self.cost_ms.items()},
+                'decisions': dict(self.counts),
+                'decision_ratio': {d: round(c / total, 3) if total else 0. for d, c in self.counts.items()}}
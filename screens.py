@@ -12,7 +12,7 @@ import string
 import numpy as np
 from levels import Level
 import time
-from config import ModeButton, LevelButton, ReturnToButton, HelpButton, VideoDisplay, TimerDisplay
+from config import ModeButton, LevelButton, ReturnToButton, HelpButton, VideoDisplay, TimerDisplay, ProfilerDisplay
 
 font_sz = metrics.dp(50)
 button_sz = metrics.dp(100)
@@ -25,6 +25,13 @@ def get_level(level_id):
 def get_button(level_id):
     return ALL_LEVELS[level_id]['button']
 
+def toggle_profiler(screen):
+    '''helper function for showing/hiding the stage timings overlay of a screen'''
+    if screen.profiler.toggle():
+        screen.canvas.add(screen.profiler)
+    else:
+        screen.canvas.remove(screen.profiler)
+
 def gen_button_text(mode, letter_set, difficulty):
     '''helper function for the MainScreen to get the correct level button text'''
     letters = set_idx_to_letters[letter_set]
@@ -199,10 +206,16 @@ class LearningScreen(Screen):
         # TODO smarter way of scaling webcam display to preserve 16:9 ratio
         self.webcam = VideoDisplay(0, 'right')
         self.canvas.add(self.webcam)
+        self.canvas.add(self.webcam.overlay)
         self.guide_video = VideoDisplay(self.level.vid_src, 'left')
         self.canvas.add(self.guide_video)
+
+        # Stage timings overlay, toggled with F3
+        self.profiler = ProfilerDisplay()
     
     def on_key_down(self, keycode, modifiers):
+        if keycode[1] == 'f3':
+            toggle_profiler(self)
         if keycode[1] == '1': #TODO temp
             print('manual unlock')
             self.unlock_next_levels()
@@ -238,11 +251,15 @@ class LearningScreen(Screen):
         self.info.text += "Letter: {}\n".format(self.level.target)
         self.info.text += self.level.feedback
 
+        if self.profiler.active:
+            self.profiler.on_update()
+
     def on_layout(self, win_size):
         resize_topleft_label(self.info)
         self.webcam.on_layout(win_size)
         self.guide_video.on_layout(win_size)
         self.intro_button.on_layout(win_size)
+        self.profiler.on_layout(win_size)
     
     def display_video(self, position):
         self.guide_video.move_to(position)
@@ -305,7 +322,11 @@ class GameScreen(Screen):
         # TODO smarter way of scaling webcam display to preserve 16:9 ratio
         self.webcam = VideoDisplay(0, 'center')
         self.canvas.add(self.webcam)
+        self.canvas.add(self.webcam.overlay)
         self.guide_video = VideoDisplay(self.level.vid_src, 'left')
+
+        # Stage timings overlay, toggled with F3
+        self.profiler = ProfilerDisplay()
     
     def display_video(self, position):
         self.guide_video.move_to(position)
@@ -327,6 +348,8 @@ class GameScreen(Screen):
         self.hide_video()
 
     def on_key_down(self, keycode, modifiers):
+        if keycode[1] == 'f3':
+            toggle_profiler(self)
         if keycode[1] == 'spacebar':
             # get new target word
             new_target = self.level.set_target(self.level.get_next_target())
@@ -399,12 +422,16 @@ class GameScreen(Screen):
         self.info.text += "Spelled so far: {}\n".format(self.level.target[:self.level._cur_letter_idx])
         self.info.text += self.level.feedback
 
+        if self.profiler.active:
+            self.profiler.on_update()
+
     def on_layout(self, win_size):
         resize_topleft_label(self.info)
         self.gmode_button.on_layout(win_size)
         self.webcam.on_layout(win_size)
         self.guide_video.on_layout(win_size)
         self.bartimer.on_layout(win_size)
+        self.profiler.on_layout(win_size)
 
     def set_level(self, level):
         self.level = level
@@ -0,0 +1,30 @@
+import os
+import sys
+import cv2
+import pytest
+
+# The modules live at the top of the repository, and read data/ and test_webcam_data/ relative to it
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+
+def read_guide_frames(letter='A', num_frames=30):
+    '''
+    The first num_frames frames of guide_videos/[letter].mp4: real frames with a hand in
+    most of them, for tests that need MediaPipe to find something.
+    '''
+    cap = cv2.VideoCapture(os.path.join(ROOT, 'guide_videos', letter + '.mp4'))
+    frames = []
+    while len(frames) < num_frames:
+        success, frame = cap.read()
+        if not success:
+            break
+        frames.append(frame)
+    cap.release()
+    assert frames, 'Could not read guide_videos/{}.mp4'.format(letter)
+    return frames
+
+@pytest.fixture
+def guide_frames():
+    return read_guide_frames
@@ -0,0 +1,69 @@
+'''
+Dataset manifest: the first open imports metadata.json once, even when several processes
+open the data folder at the same time, and the samples are read from the manifest.
+'''
+import os
+import json
+import multiprocessing
+import pytest
+
+from dataset_manifest import DatasetManifest, MANIFEST_FILE, METADATA_FILE
+
+NUM_PROCESSES = 8
+
+
+def make_data(path):
+    metadata = {'LETTER-A': {'synonyms': [], 'video_src': {'0': 'a0.mp4', '1': 'a1.mp4'}}}
+    with open(os.path.join(path, METADATA_FILE), 'w') as f:
+        json.dump(metadata, f)
+    os.mkdir(os.path.join(path, 'LETTER-A'))
+    for sample in range(3):
+        open(os.path.join(path, 'LETTER-A', '{}.csv'.format(sample)), 'w').close()
+    return metadata
+
+def open_and_allocate(path, barrier, results):
+    barrier.wait()
+    results.put(DatasetManifest(path).allocate('LETTER-A'))
+
+
+def test_import(tmp_path):
+    path = str(tmp_path)
+    metadata = make_data(path)
+    manifest = DatasetManifest(path)
+    assert manifest.metadata() == metadata
+    # 2.csv has no metadata entry, but its index is taken
+    assert manifest.next_sample_idx('LETTER-A') == 3
+
+def test_concurrent_first_open(tmp_path):
+    if not hasattr(os, 'fork'):
+        pytest.skip('needs fork')
+    path = str(tmp_path)
+    make_data(path)
+    context = multiprocessing.get_context('fork')
+    barrier = context.Barrier(NUM_PROCESSES)
+    results = context.Queue()
+    processes = [context.Process(target=open_and_allocate, args=(path, barrier, results))
+                 for _ in range(NUM_PROCESSES)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(timeout=30)
+        assert process.exitcode == 0
+    allocated = sorted(results.get(timeout=5) for _ in processes)
+    # no allocation was lost to another process importing the manifest again
+    assert allocated == list(range(3, 3 + NUM_PROCESSES))
+    assert DatasetManifest(path).next_sample_idx('LETTER-A') == 3 + NUM_PROCESSES
+
+def test_metadata_without_export(tmp_path):
+    path = str(tmp_path)
+    make_data(path)
+    manifest = DatasetManifest(path)
+    sample = manifest.register('LETTER-B', None, 'b0.mp4', ['bee'])
+    # metadata.json is not updated until it is exported, the manifest is
+    assert DatasetManifest(path).metadata()['LETTER-B'] == {'synonyms': ['bee'], 'video_src': {str(sample): 'b0.mp4'}}
+    with open(os.path.join(path, METADATA_FILE)) as f:
+        assert 'LETTER-B' not in json.load(f)
+    manifest.export_metadata()
+    with open(os.path.join(path, METADATA_FILE)) as f:
+        assert json.load(f) == manifest.metadata()
+    assert os.path.exists(os.path.join(path, MANIFEST_FILE))
@@ -0,0 +1,67 @@
+'''
+Incremental sample writers: the written samples match the DataFrame path, and a sample
+whose rows fail part way leaves nothing behind.
+'''
+import os
+import numpy as np
+import pandas as pd
+import pytest
+
+from dataset_store import LandmarkStore, LandmarkStoreWriter, CsvSampleWriter, ArraySampleWriter, \
+    write_rows, read_csv_sample, DATA_FILE, INDEX_FILE
+
+COLUMNS = ['timestamps', 'a', 'b', 'c']
+
+
+def make_rows(num_rows=5):
+    rows = np.arange(num_rows * len(COLUMNS), dtype=np.float64).reshape(num_rows, len(COLUMNS)) / 7
+    rows[1, 2:] = np.nan
+    return rows
+
+def failing_rows(rows, fail_after):
+    for idx, row in enumerate(rows):
+        if idx == fail_after:
+            raise IOError('decoding failed')
+        yield row
+
+
+def test_writers_match_dataframe(tmp_path):
+    rows = make_rows()
+    expected_csv = str(tmp_path / 'expected.csv')
+    pd.DataFrame(rows, columns=COLUMNS).to_csv(expected_csv, index=False)
+
+    csv_path = str(tmp_path / '0.csv')
+    store_writer = LandmarkStoreWriter(str(tmp_path), columns=COLUMNS)
+    array = ArraySampleWriter(len(COLUMNS), capacity=2)
+    assert write_rows(iter(rows), CsvSampleWriter(csv_path, COLUMNS), store_writer.open_sample('A', 0), array) == 5
+
+    with open(csv_path) as f, open(expected_csv) as g:
+        assert f.read() == g.read()
+    assert np.array_equal(array.array(), rows, equal_nan=True)
+    stored = LandmarkStore(str(tmp_path)).get('A', 0)
+    assert np.array_equal(stored, rows.astype(np.float32), equal_nan=True)
+    assert np.array_equal(read_csv_sample(csv_path)[1], stored, equal_nan=True)
+
+def test_failed_sample_leaves_nothing(tmp_path):
+    path = str(tmp_path)
+    store_writer = LandmarkStoreWriter(path, columns=COLUMNS)
+    store_writer.append('A', 0, make_rows())
+    data_size = os.path.getsize(os.path.join(path, DATA_FILE))
+    with open(os.path.join(path, INDEX_FILE)) as f:
+        index = f.read()
+
+    csv_path = str(tmp_path / '1.csv')
+    with pytest.raises(IOError):
+        write_rows(failing_rows(make_rows(), 3), CsvSampleWriter(csv_path, COLUMNS),
+                   store_writer.open_sample('A', 1))
+    assert not os.path.exists(csv_path)
+    assert not os.path.exists(csv_path + '.tmp')
+    assert os.path.getsize(os.path.join(path, DATA_FILE)) == data_size
+    with open(os.path.join(path, INDEX_FILE)) as f:
+        assert f.read() == index
+
+    # the next sample goes right after the first one
+    store_writer.append('A', 1, make_rows(3))
+    store = LandmarkStore(path)
+    assert store.index[('A', 1)] == (5, 3)
+    assert np.array_equal(store.get('A', 0), make_rows().astype(np.float32), equal_nan=True)
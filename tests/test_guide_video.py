@@ -0,0 +1,61 @@
+'''
+GuideClip decoding: frames skipped during a slow playback are decoded when a replay reaches them.
+'''
+import cv2
+import numpy as np
+import pytest
+
+from guide_video import GuideClip, GuideClipCache
+
+NUM_FRAMES = 60
+
+
+@pytest.fixture
+def clip_path(tmp_path):
+    '''
+    A lossless clip where frame i is filled with the value 4*i.
+    '''
+    path = str(tmp_path / 'clip.avi')
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'FFV1'), 30, (32, 24))
+    if not writer.isOpened():
+        pytest.skip('No lossless video codec available')
+    for idx in range(NUM_FRAMES):
+        writer.write(np.full((24, 32, 3), 4 * idx, dtype=np.uint8))
+    writer.release()
+    return path
+
+def frame_number(frame):
+    return int(frame[0, 0, 0]) // 4
+
+
+def test_frames_in_order(clip_path):
+    clip = GuideClip(clip_path)
+    assert [frame_number(clip.frame(idx)) for idx in range(NUM_FRAMES)] == list(range(NUM_FRAMES))
+    assert clip.frame(NUM_FRAMES) is None
+    assert clip.complete and clip.holes == 0
+
+def test_skipped_frames_filled_on_replay(clip_path):
+    clip = GuideClip(clip_path)
+    # slow playback: every 5th frame, the rest are only grabbed
+    for idx in range(0, NUM_FRAMES, 5):
+        assert frame_number(clip.frame(idx)) == idx
+    # decoded up to frame 55: 4 holes before each of the 11 decoded frames after the first
+    assert clip.holes == 11 * 4
+
+    # replay, including a jump back (seek) and short steps forward (read on)
+    for idx in [1, 2, 3, 40, 41, 7] + list(range(NUM_FRAMES)):
+        assert frame_number(clip.frame(idx)) == idx
+    assert clip.holes == 0
+    assert all(frame is not None for frame in clip.frames)
+    assert clip.nbytes == NUM_FRAMES * clip.frames[0].nbytes
+
+def test_cache_evicts_least_recently_used(clip_path):
+    cache = GuideClipCache(max_bytes=32 * 24 * 3 * NUM_FRAMES)
+    first = cache.get(clip_path, 32)
+    for idx in range(NUM_FRAMES):
+        first.frame(idx)
+    assert cache.get(clip_path, 32) is first
+    second = cache.get(clip_path, 16)
+    second.frame(0)
+    cache.trim()
+    assert list(cache.clips) == [(clip_path, 16)]
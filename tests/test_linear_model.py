@@ -0,0 +1,56 @@
+'''
+Predictions are labeled with the model's own class order, so a model whose classes are in
+another order than utils.class_labels still predicts the right words.
+'''
+import glob
+import numpy as np
+import pytest
+
+pytest.importorskip('mediapipe')
+from linear_model import LinearModel
+from batch_predictor import BatchPredictor
+from video_handler import VideoHandler
+from evaluation import replay
+from dataset_store import read_csv_sample
+from utils import pred_class_to_letter, class_labels
+
+
+@pytest.fixture
+def models():
+    model = LinearModel.load('saved_model.npz')
+    order = np.random.default_rng(0).permutation(len(model.labels))
+    permuted = LinearModel(model.coef_T.T[order], model.intercept[order], model.labels[order])
+    return model, permuted
+
+@pytest.fixture
+def rows():
+    _, rows = read_csv_sample(sorted(glob.glob('data/LETTER-B/*.csv'))[0])
+    return rows.astype(np.float64)
+
+
+def test_labels_follow_class_order(models):
+    model, permuted = models
+    X = np.random.default_rng(1).random((20, model.n_features_in_))
+    assert [model.predict_label(x)[0] for x in X] == [permuted.predict_label(x)[0] for x in X]
+    assert [pred_class_to_letter(c, permuted)[0] for c in permuted.predict_proba(X).argmax(axis=1)] == \
+        [pred_class_to_letter(c)[0] for c in model.predict_proba(X).argmax(axis=1)]
+    assert pred_class_to_letter(3)[0] == class_labels[3]
+
+def test_video_handler_uses_model_labels(models):
+    model, permuted = models
+    X = np.random.default_rng(2).random((20, model.n_features_in_))
+    predictor = BatchPredictor(model=permuted)
+    try:
+        handler = VideoHandler(None, predictor=predictor)
+        handler.pred_thresh = 0.
+        for x, prob in zip(X, model.predict_proba(X)):
+            handler.set_prediction(predictor.predict(x, timeout=5))
+            assert handler.prediction == model.labels[prob.argmax()]
+    finally:
+        predictor.close()
+
+def test_replay_uses_model_labels(models, rows):
+    model, permuted = models
+    preds = replay(rows, model)
+    assert 'LETTER-B' in preds
+    assert replay(rows, permuted) == preds
@@ -0,0 +1,111 @@
+'''
+Mirroring webcam frames once up front gives the same landmarks, handedness and drawings
+as flipping them inside LandmarkExtractor and annotate_image, and mirrored frames handed
+to the UI are not overwritten while it can still read them.
+'''
+import time
+import cv2
+import numpy as np
+import pytest
+
+pytest.importorskip('mediapipe')
+from utils import LandmarkExtractor, FrameRing, mirror, annotate_image, extract_landmarks
+from video_handler import VideoHandler
+
+
+def make_frames(num_frames=20, width=160, height=120):
+    '''
+    Frames that aren't symmetric around the y-axis, some of them black, for the frame
+    handling tests (MediaPipe finds no hands in noise: see real_frames for the landmarks).
+    '''
+    rng = np.random.default_rng(0)
+    frames = []
+    for idx in range(num_frames):
+        if idx % 7 == 3:
+            frames.append(np.zeros((height, width, 3), dtype=np.uint8))
+            continue
+        frame = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+        cv2.rectangle(frame, (10, 20), (60, 100), (255, 255, 255), -1)
+        frames.append(frame)
+    return frames
+
+@pytest.fixture
+def video_path(tmp_path):
+    path = str(tmp_path / 'frames.avi')
+    frames = make_frames(200)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 30, frames[0].shape[1::-1])
+    for frame in frames:
+        writer.write(frame)
+    writer.release()
+    return path
+
+def real_frames(guide_frames):
+    '''
+    Guide video frames of two letters, with a hand in most of them.
+    '''
+    return guide_frames('A', 30) + guide_frames('B', 30)
+
+def handedness(hand_result):
+    if not hand_result.multi_handedness:
+        return []
+    return [hd.classification[0].label for hd in hand_result.multi_handedness]
+
+
+def test_landmarks_and_handedness_unchanged(guide_frames):
+    frames = real_frames(guide_frames)
+    flipping = LandmarkExtractor(num_hands=2, pose_stride=1)
+    premirrored = LandmarkExtractor(num_hands=2, pose_stride=1, mirrored=True)
+    detected = 0
+    for frame in frames:
+        expected = flipping.process(frame.copy())
+        results = premirrored.process(mirror(frame))
+        detected += bool(expected[0].multi_hand_landmarks)
+        assert handedness(results[0]) == handedness(expected[0])
+        assert np.array_equal(extract_landmarks(*results), extract_landmarks(*expected), equal_nan=True)
+    # otherwise this only compares empty results
+    assert detected > len(frames) // 2
+
+def test_annotation_unchanged(guide_frames):
+    frames = real_frames(guide_frames)
+    extractor = LandmarkExtractor(num_hands=2, pose_stride=1)
+    detected = 0
+    for frame in frames:
+        results = extractor.process(frame)
+        detected += bool(results[0].multi_hand_landmarks)
+        expected = annotate_image(frame.copy(), *results)
+        drawn = annotate_image(mirror(frame), *results, mirrored=True)
+        assert np.array_equal(mirror(drawn), expected)
+    assert detected > len(frames) // 2
+
+def test_process_frame_returns_mirrored_frame(video_path):
+    handler = VideoHandler(video_path, draw_on_frame=False)
+    for _ in range(20):
+        raw = handler.read_frame()
+        image, _, _ = handler.process_frame(raw)
+        assert np.array_equal(image, mirror(raw))
+
+def test_frame_ring_skips_frames_in_use():
+    ring = FrameRing(3)
+    frames = [ring.next((2, 2)) for _ in range(3)]
+    assert ring.next((2, 2)) is frames[0]
+    # frames[1] is still held: it is skipped
+    assert ring.next((2, 2), in_use=[frames[1]]) is frames[2]
+    # everything is in use: a new frame rather than one being read
+    new = ring.next((2, 2), in_use=frames)
+    assert all(new is not frame for frame in frames)
+
+def test_displayed_frame_not_overwritten(video_path):
+    handler = VideoHandler(video_path, threaded=True, draw_on_frame=False)
+    result = None
+    deadline = time.monotonic() + 5
+    while result is None and time.monotonic() < deadline:
+        result = handler.get_next_frame()
+    assert result is not None
+    image = result[0]
+    copy = image.copy()
+    # keep recognition running without pulling: the UI still holds the first frame
+    while not handler.pipeline.finished and time.monotonic() < deadline:
+        handler.pipeline._last_pull = time.monotonic()
+        time.sleep(0.005)
+    handler.pipeline.stop()
+    assert np.array_equal(image, copy)
@@ -0,0 +1,62 @@
+'''
+StaticSignProcessor.process against the pandas implementation it replaced, on every sample in data/.
+'''
+import glob
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('mediapipe')
+from utils import StaticSignProcessor, COLUMNS
+from dataset_store import read_csv_sample
+
+CSV_PATHS = sorted(glob.glob('data/*/*.csv'))
+
+
+def pandas_process(df):
+    '''
+    Frozen copy of the pandas version of StaticSignProcessor.process.
+    '''
+    df_array = df.to_numpy().T  # shape: (202,num_frames)
+
+    for h in ['left','right']:
+        x1,y1,x2,y2 = df.filter(regex=h).filter(regex='_x').min().min(),df.filter(regex=h).filter(regex='_y').min().min(),df.filter(regex=h).filter(regex='_x').max().max(),df.filter(regex=h).filter(regex='_y').max().max()
+        x_cols = [df.columns.get_loc(col) for col in df.filter(regex=h).filter(regex='_x').columns]
+        y_cols = [df.columns.get_loc(col) for col in df.filter(regex=h).filter(regex='_y').columns]
+        df_array[x_cols] = (df_array[x_cols]-min(x1,x2))/(max(x1,x2)-min(x1,x2)+0.000001)
+        df_array[y_cols] = (df_array[y_cols]-min(y1,y2))/(max(y1,y2)-min(y1,y2)+0.000001)
+
+    norm_df = pd.DataFrame(data=df_array.T, columns=df.columns)
+
+    # Drop the frames in the beginning and end of the video where no hands are detected
+    # Drop the timeframe and pose data
+    start_idx = (~norm_df['lefthand_0_x'].isna() | ~norm_df['righthand_0_x'].isna()).argmax()
+    end_idx = len(norm_df) - (norm_df[::-1]['lefthand_0_x'].isna() & norm_df[::-1]['righthand_0_x'].isna()).argmin()
+
+    norm_df = norm_df.iloc[start_idx:end_idx,1:127]
+
+    # Fill empty values with the previous seen value (fillna(method=...) in older pandas)
+    norm_df = norm_df.ffill().bfill().fillna(0.)
+
+    return norm_df.mean().to_numpy()
+
+
+def test_data_found():
+    assert CSV_PATHS, 'No samples found in data/'
+
+@pytest.mark.parametrize('csv_path', CSV_PATHS)
+def test_process_matches_pandas(csv_path):
+    df = pd.read_csv(csv_path)
+    expected = pandas_process(df.copy())
+    processor = StaticSignProcessor()
+    assert np.allclose(processor.process(df), expected)
+    # the array input used by training_data.py and the landmark store
+    _, rows = read_csv_sample(csv_path)
+    assert np.allclose(processor.process(rows), expected, atol=1e-6)
+
+def test_process_does_not_modify_input():
+    df = pd.read_csv(CSV_PATHS[0])
+    before = df.copy()
+    StaticSignProcessor().process(df)
+    pd.testing.assert_frame_equal(df, before)
+    assert list(df.columns) == COLUMNS
@@ -0,0 +1,45 @@
+'''
+The recognition server makes the same predictions as the app's VideoHandler.
+'''
+import cv2
+import pytest
+
+pytest.importorskip('mediapipe')
+from video_handler import VideoHandler
+from recognition_server import RecognitionServer, _extract, _close_session
+
+
+# a real clip: hands in most frames, so the predictions are letters
+VIDEO_PATH = 'guide_videos/A.mp4'
+
+
+def test_process_landmarks_matches_process_frame():
+    app = VideoHandler(VIDEO_PATH, draw_on_frame=False)
+    server_side = VideoHandler(None)
+    predictions = []
+    try:
+        while True:
+            frame = app.read_frame()
+            if frame is None:
+                break
+            _, prediction, score = app.process_frame(frame)
+            row = _extract('test', frame, {'pose_stride': 0, 'hand_roi': False})
+            assert server_side.process_landmarks(row) == (prediction, score)
+            predictions.append(prediction)
+    finally:
+        _close_session('test')
+    # otherwise this only compares 'No hands detected'
+    assert any(prediction.startswith('LETTER-') for prediction in predictions)
+
+def test_server_session():
+    num_frames = int(cv2.VideoCapture(VIDEO_PATH).get(cv2.CAP_PROP_FRAME_COUNT))
+    server = RecognitionServer(num_workers=1, max_sessions=1)
+    try:
+        session = server.add_session(VIDEO_PATH)
+        assert server.add_session(VIDEO_PATH) is None
+        predictions = list(session.stream(timeout=60))
+    finally:
+        server.shutdown()
+    assert len(predictions) == session.frames == num_frames
+    assert [frame_idx for frame_idx, _, _, _ in predictions] == list(range(num_frames))
+    assert any(prediction.startswith('LETTER-') for _, _, prediction, _ in predictions)
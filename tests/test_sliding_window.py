@@ -0,0 +1,61 @@
+'''
+SlidingWindowFeatures against StaticSignProcessor.process on the same windows.
+'''
+import glob
+import numpy as np
+import pytest
+
+pytest.importorskip('mediapipe')
+from utils import StaticSignProcessor, SlidingWindowFeatures, NUM_COLUMNS, HAND_COLS
+from dataset_store import read_csv_sample
+
+WINDOW_SIZES = [1, 3, 10]
+
+
+def make_stream(rng, num_frames=80):
+    '''
+    Landmark rows where each hand comes and goes, with all-NaN frames at the start, in the
+    middle and at the end of the stream.
+    '''
+    rows = rng.random((num_frames, NUM_COLUMNS))
+    for hand in range(2):
+        cols = slice(1 + hand*HAND_COLS, 1 + (hand+1)*HAND_COLS)
+        missing = rng.random(num_frames) < 0.3
+        # gaps of a few frames
+        missing |= np.convolve(rng.random(num_frames) < 0.05, np.ones(4), mode='same') > 0
+        rows[missing, cols] = np.nan
+    rows[:7, 1:1+2*HAND_COLS] = np.nan
+    rows[35:50, 1:1+2*HAND_COLS] = np.nan
+    rows[-6:, 1:1+2*HAND_COLS] = np.nan
+    return rows
+
+def check_stream(rows, window_size):
+    processor = StaticSignProcessor()
+    window = SlidingWindowFeatures(window_size)
+    for t, row in enumerate(rows):
+        window.push(row)
+        expected = processor.process(rows[max(0, t+1-window_size):t+1])
+        assert np.allclose(window.features(), expected, rtol=0, atol=1e-9), 'frame {}'.format(t)
+
+
+@pytest.mark.parametrize('window_size', WINDOW_SIZES)
+@pytest.mark.parametrize('seed', range(5))
+def test_matches_process(seed, window_size):
+    check_stream(make_stream(np.random.default_rng(seed)), window_size)
+
+@pytest.mark.parametrize('csv_path', sorted(glob.glob('data/*/*.csv'))[::25])
+def test_matches_process_on_samples(csv_path):
+    _, rows = read_csv_sample(csv_path)
+    check_stream(rows.astype(np.float64), 10)
+
+def test_reset():
+    rng = np.random.default_rng(0)
+    window = SlidingWindowFeatures(10)
+    for row in make_stream(rng, 20):
+        window.push(row)
+    window.reset()
+    rows = make_stream(rng, 30)
+    for row in rows:
+        window.push(row)
+    assert len(window) == 10
+    assert np.allclose(window.features(), StaticSignProcessor().process(rows[-10:]), rtol=0, atol=1e-9)
@@ -0,0 +1,47 @@
+'''
+Cached feature building: from the csv files or the landmark store, only changed samples are processed.
+'''
+import shutil
+import numpy as np
+import pytest
+
+pytest.importorskip('mediapipe')
+from training_data import build_features
+from dataset_store import LandmarkStore, LandmarkStoreWriter, convert_csv_tree
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    path = str(tmp_path / 'data')
+    shutil.copytree('data', path, ignore=shutil.ignore_patterns('features.npz', 'landmarks*'))
+    return path
+
+def num_processed(capsys):
+    out = capsys.readouterr().out.strip().splitlines()[-1]
+    return int(out.split(': ')[1].split()[0])
+
+
+def test_store_matches_csv(data_dir, capsys):
+    from_csv = build_features(data_dir)
+    assert num_processed(capsys) == len(from_csv[0])
+    build_features(data_dir)
+    assert num_processed(capsys) == 0
+
+    convert_csv_tree(data_dir)
+    from_store = build_features(data_dir)
+    assert 'store' in capsys.readouterr().out
+    for a, b in zip(from_csv, from_store):
+        assert np.array_equal(a, b)
+
+def test_only_changed_samples_processed(data_dir, capsys):
+    convert_csv_tree(data_dir)
+    features, _, labels, sample_idxs = build_features(data_dir)
+    rows = np.array(LandmarkStore(data_dir).get(labels[0], sample_idxs[0]))
+    rows[:, 1] += 0.1
+    LandmarkStoreWriter(data_dir).append(labels[0], sample_idxs[0], rows)
+    capsys.readouterr()
+
+    updated, _, _, _ = build_features(data_dir)
+    assert num_processed(capsys) == 1
+    assert not np.array_equal(updated[0], features[0])
+    assert np.array_equal(updated[1:], features[1:])
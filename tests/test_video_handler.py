@@ -0,0 +1,100 @@
+'''
+VideoHandler.reset starts the next video from a clean state, including MediaPipe's,
+and a threaded handler keeps running when it is switched to another source.
+'''
+import time
+import cv2
+import numpy as np
+import pytest
+
+pytest.importorskip('mediapipe')
+from video_handler import VideoHandler
+
+
+def write_clip(path, value, num_frames=10):
+    '''
+    A clip whose frames are all value, so each frame shows which clip it came from.
+    '''
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 30, (64, 48))
+    for _ in range(num_frames):
+        writer.write(np.full((48, 64, 3), value, dtype=np.uint8))
+    writer.release()
+    return path
+
+def pull_frames(handler, timeout=10):
+    '''
+    Pulls frames from a threaded handler until its source runs out.
+    '''
+    frames = []
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        result = handler.get_next_frame()
+        if result is not None:
+            frames.append(result[0].copy())
+        elif handler.pipeline.finished and not handler.pipeline.is_running():
+            break
+        else:
+            time.sleep(0.005)
+    return frames
+
+
+def test_reset_replaces_extractor(guide_frames):
+    handler = VideoHandler(None, hand_roi=True)
+    for frame in guide_frames('A', 30):
+        handler.process_frame(frame)
+        if handler.extractor.roi is not None:
+            break
+    extractor = handler.extractor
+    # the hand was found, so the next frame would only be searched around it
+    assert handler.last_results is not None and extractor.roi is not None
+
+    closed = []
+    extractor.close = lambda: closed.append(True)
+    handler.reset()
+    # the graphs still belong to whichever thread runs them until the next frame
+    assert handler.extractor is extractor and not closed
+    handler.process_frame(np.zeros_like(frame))
+    assert closed and handler.extractor is not extractor
+    assert handler.extractor.frame_idx == 1 and handler.extractor.roi is None
+
+def test_no_hands_keeps_extractor(guide_frames):
+    frames = guide_frames('A', 30)
+    handler = VideoHandler(None)
+    detected = 0
+    for frame in frames:
+        handler.process_frame(frame)
+        detected += handler.last_results is not None
+    assert detected > len(frames) // 2
+    extractor = handler.extractor
+    handler.process_frame(np.zeros_like(frames[0]))
+    assert handler.last_results is None
+    handler.process_frame(frames[-1])
+    assert handler.extractor is extractor
+
+def test_load_source_after_source_ran_out(tmp_path):
+    handler = VideoHandler(write_clip(str(tmp_path / 'dark.avi'), 40), threaded=True, draw_on_frame=False)
+    try:
+        assert pull_frames(handler)
+        handler.load_source(write_clip(str(tmp_path / 'bright.avi'), 200))
+        frames = pull_frames(handler)
+    finally:
+        handler.pipeline.stop()
+    # the pipeline runs again, and nothing of the first clip is left to show
+    assert frames and all(abs(frame.mean() - 200) < 10 for frame in frames)
+
+def test_load_source_drops_pending_result(tmp_path):
+    # long enough to still be running after the first pull
+    handler = VideoHandler(write_clip(str(tmp_path / 'dark.avi'), 40, 300), threaded=True, draw_on_frame=False)
+    try:
+        deadline = time.monotonic() + 10
+        while handler.get_next_frame() is None and time.monotonic() < deadline:
+            time.sleep(0.005)
+        # let a result of the dark clip wait in the queue
+        while not handler.pipeline.results.items() and time.monotonic() < deadline:
+            time.sleep(0.005)
+        assert handler.pipeline.results.items()
+        handler.load_source(write_clip(str(tmp_path / 'bright.avi'), 200))
+        frames = pull_frames(handler)
+    finally:
+        handler.pipeline.stop()
+    assert frames and all(abs(frame.mean() - 200) < 10 for frame in frames)
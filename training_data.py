@@ -0,0 +1,183 @@
+'''
+Builds the training data for the recognition model from the binary landmark store in data/
+(see dataset_store.py), or from data/[WORD]/[sample_idx].csv if there is no store,
+and caches the processed features so they are only computed again for changed samples.
+
+The cache (data/features.npz) holds, for every sample, the output of
+StaticSignProcessor.process and of flip_hands, and a manifest with the processor version,
+where the samples were read from, and for each sample:
+- from the store: the hash of its rows, which are memory-mapped, so checking them is cheap
+- from csv files: the file's size, modification time and content hash. Files with the same
+  size and modification time are reused without being read, and files that changed on disk
+  but have the same hash are reused too
+New or modified samples are processed again and deleted ones are dropped. Everything is
+processed again if StaticSignProcessor.version changed or the samples come from elsewhere.
+
+In the training notebook:
+from training_data import training_set
+X_data, y_data = training_set(n=10, std=0.02, rng=np.random.default_rng(0))
+or, to stream the augmented data in mini-batches instead of building it all in memory,
+see augmented_batches().
+'''
+import os
+import sys
+import json
+import hashlib
+import numpy as np
+from utils import StaticSignProcessor, file_hash, sampled_words, class_labels
+from dataset_store import LandmarkStore, store_exists, read_csv_sample
+
+CACHE_FILE = 'features.npz'
+
+
+def list_samples(data_dir='data', words=None):
+    '''
+    Returns the sorted (word, sample_idx, path) of every csv sample under data_dir.
+    '''
+    samples = []
+    for word in sorted(os.listdir(data_dir)):
+        word_dir = os.path.join(data_dir, word)
+        if not os.path.isdir(word_dir) or (words is not None and word not in words):
+            continue
+        for file in os.listdir(word_dir):
+            name, ext = os.path.splitext(file)
+            if ext == '.csv' and name.isdigit():
+                samples.append((word, int(name), os.path.join(word_dir, file)))
+    return sorted(samples)
+
+def load_cache(cache_path):
+    '''
+    Returns (manifest, features, flipped) from a cache file, or empty ones if there is none.
+    '''
+    if not os.path.exists(cache_path):
+        return {'version': None, 'source': None, 'samples': {}}, None, None
+    with np.load(cache_path) as cache:
+        manifest = json.loads(str(cache['manifest']))
+        return manifest, cache['features'], cache['flipped']
+
+def build_features(data_dir='data', cache_path=None, processor=None, words=None, verbose=True):
+    '''
+    Returns (features, flipped, labels, sample_idxs) for every sample under data_dir:
+    the (num_samples, 126) processed features, the same with the hands swapped, and each
+    sample's word and index. Only samples that changed since the last build are processed.
+    The samples are read from the landmark store in data_dir if there is one (no csv parsing),
+    else from the csv files.
+    '''
+    cache_path = cache_path or os.path.join(data_dir, CACHE_FILE)
+    processor = processor or StaticSignProcessor()
+    store = LandmarkStore(data_dir) if store_exists(data_dir) else None
+    source = 'store' if store is not None else 'csv'
+    manifest, cached_features, cached_flipped = load_cache(cache_path)
+    if (manifest['version'], manifest.get('source')) != (processor.version, source):
+        manifest = {'version': processor.version, 'source': source, 'samples': {}}
+
+    if store is not None:
+        samples = [(word, sample_idx, None) for word, sample_idx in sorted(store.index)
+                   if words is None or word in words]
+    else:
+        samples = list_samples(data_dir, words)
+    features = np.empty((len(samples), 126))
+    flipped = np.empty((len(samples), 126))
+    entries = {}
+    num_processed = 0
+    for i, (word, sample_idx, path) in enumerate(samples):
+        key = '{}/{}'.format(word, sample_idx)
+        entry = manifest['samples'].get(key)
+        if store is not None:
+            # the store is memory-mapped: hashing a sample's rows needs no parsing
+            rows = store.get(word, sample_idx)
+            sha = hashlib.sha1(rows.tobytes()).hexdigest()
+            if entry and entry['sha1'] != sha:
+                entry = None
+            new_entry = {'sha1': sha}
+        else:
+            rows = None
+            stat = os.stat(path)
+            if entry and (entry['size'], entry['mtime']) != (stat.st_size, stat.st_mtime_ns):
+                # touched: still reusable if the content is the same
+                sha = file_hash(path)
+                entry = dict(entry, size=stat.st_size, mtime=stat.st_mtime_ns) if entry['sha1'] == sha else None
+            if not entry:
+                new_entry = {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'sha1': file_hash(path)}
+        if entry:
+            features[i] = cached_features[entry['row']]
+            flipped[i] = cached_flipped[entry['row']]
+        else:
+            if rows is None:
+                _, rows = read_csv_sample(path)
+            features[i] = processor.process(rows)
+            flipped[i] = processor.flip_hands(features[i])
+            entry = new_entry
+            num_processed += 1
+        entries[key] = dict(entry, row=i)
+
+    changed = num_processed or len(entries) != len(manifest['samples']) or \
+        any(manifest['samples'].get(key) != entry for key, entry in entries.items())
+    if changed:
+        manifest['samples'] = entries
+        # write to a temporary file and swap it in, so the cache is never half written
+        tmp_path = cache_path + '.tmp.npz'
+        np.savez(tmp_path, features=features, flipped=flipped, manifest=json.dumps(manifest))
+        os.replace(tmp_path, cache_path)
+    if verbose:
+        print('{} samples ({}): {} processed, {} from cache'.format(
+            len(samples), source, num_processed, len(samples) - num_processed))
+
+    labels = np.array([word for word, _, _ in samples])
+    sample_idxs = np.array([sample_idx for _, sample_idx, _ in samples])
+    return features, flipped, labels, sample_idxs
+
+def training_set(n=10, std=0.02, data_dir='data', words=sampled_words, processor=None, rng=None):
+    '''
+    Returns (X_data, y_data) laid out like the training notebook builds them: for every sample,
+    its features and n augmented copies, then its flipped features and n augmented copies.
+    y_data holds the class indices of utils.class_labels, as a column vector.
+    '''
+    processor = processor or StaticSignProcessor()
+    features, flipped, labels, _ = build_features(data_dir, processor=processor, words=words)
+    X, y = interleave_flipped(features, flipped, labels)
+    augmented = processor.augment(X, n, std, rng)
+    X_data = np.concatenate((X[:, None], augmented), axis=1).reshape(-1, X.shape[1])
+    return X_data, np.repeat(y, n + 1)[:, None]
+
+def interleave_flipped(features, flipped, labels):
+    '''
+    Returns the (2*num_samples, 126) features with each sample followed by its flipped version,
+    and their class indices.
+    '''
+    X = np.stack((features, flipped), axis=1).reshape(-1, features.shape[1])
+    y = np.repeat(np.searchsorted(class_labels, labels), 2)
+    return X, y
+
+def augmented_batches(X, y, n=10, std=0.02, batch_size=256, shuffle=True, rng=None, processor=None):
+    '''
+    Yields (X_batch, y_batch) mini-batches of the samples in X and their n augmented copies,
+    generated lazily so that memory use doesn't grow with n. Every batch holds whole groups of
+    a sample and its copies, so batch_size is rounded down to a multiple of n+1.
+    One pass over the generator is one epoch; with shuffle, the sample order and the rows of
+    each batch are shuffled.
+
+    features, flipped, labels, _ = build_features()
+    X, y = interleave_flipped(features, flipped, labels)
+    for epoch in range(epochs):
+        for X_batch, y_batch in augmented_batches(X, y, rng=rng):
+            ...
+    '''
+    rng = rng or np.random.default_rng()
+    processor = processor or StaticSignProcessor()
+    X = np.asarray(X)
+    y = np.asarray(y).reshape(len(X), -1)
+    samples_per_batch = max(1, batch_size // (n + 1))
+    order = rng.permutation(len(X)) if shuffle else np.arange(len(X))
+    for start in range(0, len(X), samples_per_batch):
+        idx = order[start:start+samples_per_batch]
+        X_batch = np.concatenate((X[idx, None], processor.augment(X[idx], n, std, rng)), axis=1)
+        X_batch = X_batch.reshape(-1, X.shape[1])
+        y_batch = np.repeat(y[idx], n + 1, axis=0)
+        if shuffle:
+            rows = rng.permutation(len(X_batch))
+            X_batch, y_batch = X_batch[rows], y_batch[rows]
+        yield X_batch, y_batch
+
+if __name__ == "__main__":
+    build_features(*sys.argv[1:2])
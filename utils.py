@@ -3,7 +3,10 @@ import numpy as np
 import pandas as pd
 import mediapipe as mp
 import string
-from sklearn import preprocessing
+import hashlib
+from collections import deque
+import profiling
+from frame_utils import resize_to_width, reuse_buffer, FrameRing, mirror
 # from SignBankRefIDs import SB_REF_IDS
 # from requests_html import HTMLSession
 
@@ -11,18 +14,23 @@ from sklearn import preprocessing
 mp_drawing = mp.solutions.drawing_utils
 mp_hands = mp.solutions.hands
 mp_pose = mp.solutions.pose
-hands = mp_hands.Hands(
-    max_num_hands=2,
-    min_detection_confidence=0.5,
-    min_tracking_confidence=0.5)
-one_hand = mp_hands.Hands(
-    max_num_hands=1,
-    min_detection_confidence=0.5,
-    min_tracking_confidence=0.5)
-pose = mp_pose.Pose(
-    upper_body_only=True,
-    min_detection_confidence=0.5,
-    min_tracking_confidence=0.5)
+# Graphs used by mp_process_image, by number of hands, and 'pose'. They are created on first
+# use, so that importing utils (e.g. in worker processes using LandmarkExtractor) doesn't load them
+_graphs = {}
+
+def _graph(key):
+    if key not in _graphs:
+        if key == 'pose':
+            _graphs[key] = mp_pose.Pose(
+                upper_body_only=True,
+                min_detection_confidence=0.5,
+                min_tracking_confidence=0.5)
+        else:
+            _graphs[key] = mp_hands.Hands(
+                max_num_hands=key,
+                min_detection_confidence=0.5,
+                min_tracking_confidence=0.5)
+    return _graphs[key]
 
 def mp_process_image(image, num_hands=1):
     # Flip image around y-axis for correct handedness output.
@@ -31,63 +39,298 @@ def mp_process_image(image, num_hands=1):
     image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
     # To improve performance, optionally mark the image as not writeable.
     image.flags.writeable = False
-    if num_hands == 2:
-        hand_result = hands.process(image)
-    else:
-        hand_result = one_hand.process(image)
-    pose_result = pose.process(image)
+    hand_result = _graph(2 if num_hands == 2 else 1).process(image)
+    pose_result = _graph('pose').process(image)
 
     return [hand_result, pose_result]
 
-def mp_process_video(video_src, num_hands=2, show=False):
+def file_hash(path, chunk_size=2**20):
+    '''
+    Returns the sha1 hex digest of a file's content, read in chunks.
+    '''
+    sha = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+def hand_bbox(hand_result):
+    '''
+    Returns the normalized (x0, y0, x1, y1) bounding box of all detected hand landmarks, or None.
+    '''
+    if not hand_result.multi_hand_landmarks:
+        return None
+    xs = [lm.x for hand_landmarks in hand_result.multi_hand_landmarks for lm in hand_landmarks.landmark]
+    ys = [lm.y for hand_landmarks in hand_result.multi_hand_landmarks for lm in hand_landmarks.landmark]
+    return (min(xs), min(ys), max(xs), max(ys))
+
+class LandmarkExtractor():
+    '''
+    Runs the MediaPipe graphs on video frames, like mp_process_image,
+    but only the graphs that are actually needed. Each extractor owns its own graphs.
+
+    pose_stride: run the pose graph every pose_stride frames and reuse the last pose result
+    in between. 0 disables pose tracking entirely (pose result is None).
+    inference_width: downscale frames to at most this width before running MediaPipe.
+    hand_roi: once a hand is found, run the hand graph only on a crop around the previous
+    frame's hands (expanded by roi_margin of the hand size on each side). Landmarks are mapped
+    back to full-frame coordinates, so results look the same as without cropping.
+    mirrored: the frames passed to process() are already flipped around the y-axis
+    (the orientation MediaPipe needs for correct handedness), so they aren't flipped again.
+    The flipped, downscaled and RGB frames are written into buffers reused for every frame.
+    '''
+    def __init__(self, num_hands=1, pose_stride=1, min_detection_confidence=0.5, min_tracking_confidence=0.5,
+                 inference_width=None, hand_roi=False, roi_margin=0.5, mirrored=False):
+        assert pose_stride >= 0, 'Pose stride must be a non-negative number'
+        self.num_hands = num_hands
+        self.pose_stride = pose_stride
+        self.inference_width = inference_width
+        self.hand_roi = hand_roi
+        self.roi_margin = roi_margin
+        self.mirrored = mirrored
+        self._flipped = self._small = self._rgb = None
+        self.hands = mp_hands.Hands(
+            max_num_hands=num_hands,
+            min_detection_confidence=min_detection_confidence,
+            min_tracking_confidence=min_tracking_confidence)
+        # Crops get their own graph so its tracking state isn't mixed up with full frames
+        self.roi_hands = None
+        if hand_roi:
+            self.roi_hands = mp_hands.Hands(
+                max_num_hands=num_hands,
+                min_detection_confidence=min_detection_confidence,
+                min_tracking_confidence=min_tracking_confidence)
+        self.pose = None
+        if pose_stride:
+            self.pose = mp_pose.Pose(
+                upper_body_only=True,
+                min_detection_confidence=min_detection_confidence,
+                min_tracking_confidence=min_tracking_confidence)
+        self.frame_idx = 0
+        self.last_pose_result = None
+        self.roi = None  # normalized (x0, y0, x1, y1) crop for the next frame
+
+    def process(self, image):
+        if not self.mirrored:
+            # Flip image around y-axis for correct handedness output.
+            with profiling.timer('flip'):
+                image = self._flipped = mirror(image, self._flipped)
+        hand_result = None
+        if self.roi is not None:
+            with profiling.timer('hands_roi'):
+                hand_result = self._process_roi(image)
+        small = None
+        if hand_result is None:
+            with profiling.timer('convert'):
+                small = self._to_rgb(image)
+            with profiling.timer('hands'):
+                hand_result = self.hands.process(small)
+        if self.hand_roi:
+            self._update_roi(hand_result)
+
+        if self.pose and self.frame_idx % self.pose_stride == 0:
+            if small is None:
+                with profiling.timer('convert'):
+                    small = self._to_rgb(image)
+            with profiling.timer('pose'):
+                self.last_pose_result = self.pose.process(small)
+        self.frame_idx += 1
+
+        return [hand_result, self.last_pose_result]
+
+    def _to_rgb(self, image):
+        '''
+        Downscales image to inference_width and converts it to RGB, in reused buffers.
+        Same result as cv2.cvtColor(resize_to_width(image, inference_width), cv2.COLOR_BGR2RGB).
+        '''
+        height, width = image.shape[:2]
+        if self.inference_width is not None and width > self.inference_width:
+            size = (self.inference_width, max(1, round(height * self.inference_width / width)))
+            self._small = reuse_buffer(self._small, (size[1], size[0]) + image.shape[2:])
+            image = cv2.resize(image, size, dst=self._small, interpolation=cv2.INTER_AREA)
+        self._rgb = reuse_buffer(self._rgb, image.shape)
+        cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=self._rgb)
+        # To improve performance, mark the image as not writeable.
+        self._rgb.flags.writeable = False
+        return self._rgb
+
+    def _process_roi(self, image):
+        '''
+        Runs the hand graph on the crop given by self.roi and maps the landmarks back
+        to full-frame coordinates. Returns None if no hands were found in the crop.
+        '''
+        height, width = image.shape[:2]
+        x0, y0, x1, y1 = self.roi
+        px0, py0 = int(x0 * width), int(y0 * height)
+        px1, py1 = max(px0 + 1, int(np.ceil(x1 * width))), max(py0 + 1, int(np.ceil(y1 * height)))
+        crop = cv2.cvtColor(resize_to_width(image[py0:py1, px0:px1], self.inference_width), cv2.COLOR_BGR2RGB)
+        crop.flags.writeable = False
+        hand_result = self.roi_hands.process(crop)
+        if not hand_result.multi_hand_landmarks:
+            return None
+
+        sx, sy = (px1 - px0) / width, (py1 - py0) / height
+        ox, oy = px0 / width, py0 / height
+        for hand_landmarks in hand_result.multi_hand_landmarks:
+            for lm in hand_landmarks.landmark:
+                lm.x = ox + lm.x * sx
+                lm.y = oy + lm.y * sy
+                # z uses roughly the same scale as x
+                lm.z = lm.z * sx
+        return hand_result
+
+    def _update_roi(self, hand_result):
+        bbox = hand_bbox(hand_result)
+        if bbox is None:
+            self.roi = None
+            return
+        x0, y0, x1, y1 = bbox
+        if self.roi is not None:
+            # Keep the crop stable while the hands stay well inside it and it isn't much too big
+            rx0, ry0, rx1, ry1 = self.roi
+            inset_x, inset_y = (rx1 - rx0) * 0.1, (ry1 - ry0) * 0.1
+            inside = rx0 + inset_x <= x0 and x1 <= rx1 - inset_x and ry0 + inset_y <= y0 and y1 <= ry1 - inset_y
+            too_big = (rx1 - rx0) * (ry1 - ry0) > 4 * (1 + 2*self.roi_margin)**2 * (x1 - x0) * (y1 - y0)
+            if inside and not too_big:
+                return
+        size = max(x1 - x0, y1 - y0) * self.roi_margin
+        self.roi = (max(0., x0 - size), max(0., y0 - size), min(1., x1 + size), min(1., y1 + size))
+
+    def close(self):
+        self.hands.close()
+        if self.roi_hands:
+            self.roi_hands.close()
+        if self.pose:
+            self.pose.close()
+
+def iter_video_results(video_src, num_hands=2, show=False, extractor=None):
+    '''
+    Runs mediapipe on every frame of a video source as it is decoded.
+    If a LandmarkExtractor is given, its graphs are used instead of the module-level ones.
+    Yields (timestamp, hand_result, pose_result) for each frame.
+    Raises IOError if the video source can't be opened.
+    '''
+    cap = cv2.VideoCapture(video_src)
+    if not cap.isOpened():
+        raise IOError('Could not open video source: {}'.format(video_src))
+    try:
+        while cap.isOpened():
+            success, image = cap.read()
+            if not success:
+                # If loading from webcam, use 'continue' instead of 'break'.
+                break
+
+            timestamp = cap.get(cv2.CAP_PROP_POS_MSEC)
+            if extractor:
+                hand_result, pose_result = extractor.process(image)
+            else:
+                hand_result, pose_result = mp_process_image(image, num_hands=num_hands)
+
+            yield timestamp, hand_result, pose_result
+
+            # Draw the hand and pose annotations on the image.
+            if show:
+                image = annotate_image(image, hand_result, pose_result)
+                cv2.imshow('MediaPipe Processed Video', image)
+                if cv2.waitKey(5) & 0xFF == 27:
+                    break
+    finally:
+        cap.release()
+
+def iter_video_landmarks(video_src, num_hands=2, show=False, extractor=None):
+    '''
+    Streaming version of generate_dataframe(mp_process_video(...)): yields the landmark row
+    of each frame (NUM_COLUMNS values: timestamp, hands and pose, see COLUMNS) as it is decoded,
+    so no mediapipe results are kept and memory use doesn't grow with the video length.
+    Each row is a new array. See dataset_store.write_rows for writing the rows as they come.
+    '''
+    for timestamp, hand_result, pose_result in iter_video_results(video_src, num_hands, show, extractor):
+        yield extract_landmarks(hand_result, pose_result, timestamp)
+
+def mp_process_video(video_src, num_hands=2, show=False, extractor=None):
     '''
     Process hand and pose information from video source using mediapipe.
+    If a LandmarkExtractor is given, its graphs are used instead of the module-level ones.
+    Keeps the results of every frame, prefer iter_video_landmarks for long videos.
     Returns:
     A dict containing timestamps, hand_results, and pose_results
     '''
-    cap = cv2.VideoCapture(video_src)
     timestamps = []
     hand_results = []
     pose_results = []
-
-    while cap.isOpened():
-        success, image = cap.read()
-        if not success:
-            # If loading from webcam, use 'continue' instead of 'break'.
-            break
-
-        timestamps.append(cap.get(cv2.CAP_PROP_POS_MSEC))
-        hand_result, pose_result = mp_process_image(image, num_hands=num_hands)
-
+    for timestamp, hand_result, pose_result in iter_video_results(video_src, num_hands, show, extractor):
+        timestamps.append(timestamp)
         hand_results.append(hand_result)
         pose_results.append(pose_result)
 
-        # Draw the hand and pose annotations on the image.
-        if show:
-            image = annotate_image(image, hand_result, pose_result)
-            cv2.imshow('MediaPipe Processed Video', image)
-            if cv2.waitKey(5) & 0xFF == 27:
-                break
-
-    cap.release()
     return {'timestamps': timestamps,
             'hand_results': hand_results,
             'pose_results': pose_results}
 
-def annotate_image(image, hand_result, pose_result):
+def annotate_image(image, hand_result, pose_result, mirrored=False):
+    '''
+    Draws the landmarks on image. MediaPipe ran on the mirrored frame, so the landmarks are drawn
+    on a mirrored copy and flipped back, unless image is mirrored already (drawn in place).
+    '''
     image.flags.writeable = True
-    image = cv2.flip(image, 1)
+    if not mirrored:
+        image = cv2.flip(image, 1)
 
-    mp_drawing.draw_landmarks(
-        image, pose_result.pose_landmarks, mp_pose.UPPER_BODY_POSE_CONNECTIONS)
+    if pose_result:
+        mp_drawing.draw_landmarks(
+            image, pose_result.pose_landmarks, mp_pose.UPPER_BODY_POSE_CONNECTIONS)
     if hand_result.multi_hand_landmarks:
         for hand_landmarks in hand_result.multi_hand_landmarks:
             mp_drawing.draw_landmarks(
                 image, hand_landmarks, mp_hands.HAND_CONNECTIONS)
     
-    image = cv2.flip(image, 1)
+    if not mirrored:
+        image = cv2.flip(image, 1)
     return image
 
+# Column layout of a parsed frame: timestamp, 2 hands x 21 joints x xyz, 25 pose joints x xyz
+COLUMNS = ['timestamps'] + \
+        [_type+'_'+str(idx)+'_'+coord \
+            for _type in ['lefthand','righthand'] \
+            for idx in range(len(mp_hands.HAND_CONNECTIONS)) \
+            for coord in ['x','y','z']] + \
+        ['pose_'+str(idx)+'_'+coord \
+            for idx in range(len(mp_pose.UPPER_BODY_POSE_CONNECTIONS)) \
+            for coord in ['x','y','z']]
+NUM_COLUMNS = len(COLUMNS)
+HAND_COLS = len(mp_hands.HAND_CONNECTIONS) * 3
+
+def extract_landmarks(hand_result, pose_result, timestamp=0.0, out=None):
+    '''
+    Parses the MediaPipe results of a single frame into a row of NUM_COLUMNS (202) values,
+    NaN where a hand or the pose was not detected (or pose_result is None).
+    If out is given, the row is written into it in place.
+    '''
+    if out is None:
+        out = np.empty(NUM_COLUMNS)
+    out[0] = timestamp
+    out[1:] = np.nan
+
+    if hand_result.multi_handedness:
+        # Resolve cases where two hands are detected but they are classified as both left or both right
+        if len(hand_result.multi_handedness) == 2 and \
+            hand_result.multi_handedness[0].classification[0].label == hand_result.multi_handedness[1].classification[0].label:
+            # For now, arbitrarily set the first one as left and second as right
+            # Possible improvement here is to infer the correct classification based on previous frames
+            hand_result.multi_handedness[0].classification[0].label = 'Left'
+            hand_result.multi_handedness[1].classification[0].label = 'Right'
+
+        for hand_idx, hand_landmarks in enumerate(hand_result.multi_hand_landmarks):
+            handedness = 0 if hand_result.multi_handedness[hand_idx].classification[0].label == 'Left' else 1
+            start = 1 + handedness * HAND_COLS
+            out[start:start+HAND_COLS] = [c for lm in hand_landmarks.landmark for c in (lm.x, lm.y, lm.z)]
+
+    if pose_result and pose_result.pose_landmarks:
+        start = 1 + 2 * HAND_COLS
+        out[start:] = [c for lm in pose_result.pose_landmarks.landmark for c in (lm.x, lm.y, lm.z)]
+
+    return out
+
 def generate_dataframe(processed):
     '''
     Parses the dict containing timestamps, hand_results, and pose_results
@@ -97,134 +340,117 @@ def generate_dataframe(processed):
     hand_results = processed['hand_results']
     pose_results = processed['pose_results']
 
-    data = []
-
-    # Get hand and pose data for each frame and append the combined array to data
+    data = np.empty((len(timestamps), NUM_COLUMNS))
     for frame_idx in range(len(timestamps)):
-        hand_data = hand_results[frame_idx]
-        pose_data = pose_results[frame_idx]
-
-        # Initialize the 2 x 63 hand array
-        hand_coords = np.array([[np.nan] * len(mp_hands.HAND_CONNECTIONS) * 3] * 2)
-
-        if hand_data.multi_handedness:
-            # Resolve cases where two hands are detected but they are classified as both left or both right
-            if len(hand_data.multi_handedness) == 2 and \
-                hand_data.multi_handedness[0].classification[0].label == hand_data.multi_handedness[1].classification[0].label:
-                # For now, arbitrarily set the first one as left and second as right
-                # Possible improvement here is to infer the correct classification based on previous frames
-                hand_data.multi_handedness[0].classification[0].label = 'Left'
-                hand_data.multi_handedness[1].classification[0].label = 'Right'
-
-            for hand_idx, hand_landmarks in enumerate(hand_data.multi_hand_landmarks):
-                handedness = 0 if hand_data.multi_handedness[hand_idx].classification[0].label == 'Left' else 1
-                hand_coords[handedness] = np.array([[lm.x, lm.y, lm.z] for lm in hand_landmarks.landmark]).flatten()
-
-        hand_coords = hand_coords.flatten()
-
-        # Initialize the 1 x 75 pose array
-        pose_coords = np.array([np.nan] * len(mp_pose.UPPER_BODY_POSE_CONNECTIONS) * 3)
-
-        if pose_data.pose_landmarks:
-            pose_coords = np.array([[lm.x, lm.y, lm.z] for lm in pose_data.pose_landmarks.landmark]).flatten()
-
-        frame_data = np.append([timestamps[frame_idx]], np.append(hand_coords, pose_coords))
-        data.append(frame_data)
-
-    data = np.array(data)
-    columns = ['timestamps'] + \
-            [_type+'_'+str(idx)+'_'+coord \
-                for _type in ['lefthand','righthand'] \
-                for idx in range(len(mp_hands.HAND_CONNECTIONS)) \
-                for coord in ['x','y','z']] + \
-            ['pose_'+str(idx)+'_'+coord \
-                for idx in range(len(mp_pose.UPPER_BODY_POSE_CONNECTIONS)) \
-                for coord in ['x','y','z']]
-    df = pd.DataFrame(data=data, columns=columns)
+        extract_landmarks(hand_results[frame_idx], pose_results[frame_idx], timestamps[frame_idx], out=data[frame_idx])
+
+    df = pd.DataFrame(data=data, columns=COLUMNS)
     return df
 
+class LandmarkRingBuffer():
+    '''
+    Preallocated buffer holding the landmark rows of the last `size` frames (float32).
+    Each frame's landmarks are extracted once, straight into the buffer.
+    Every row is stored twice, `size` rows apart, so the newest frames are always
+    a contiguous slice and window() can return a view instead of a copy.
+    '''
+    def __init__(self, size=10):
+        assert size > 0, 'Buffer size must be a positive number'
+        self.size = size
+        self._data = np.full((2*size, NUM_COLUMNS), np.nan, dtype=np.float32)
+        self.reset()
+
+    def reset(self):
+        self.count = 0  # frames pushed since the last reset
+        self._pos = 0   # next slot to write
+
+    def push(self, hand_result, pose_result, timestamp=0.0):
+        row = extract_landmarks(hand_result, pose_result, timestamp, out=self._data[self._pos])
+        return self._advance(row)
+
+    def push_row(self, row):
+        '''
+        Adds a landmark row that was already extracted (e.g. in another process).
+        '''
+        self._data[self._pos] = row
+        return self._advance(self._data[self._pos])
+
+    def _advance(self, row):
+        self._data[self._pos + self.size] = row
+        self._pos = (self._pos + 1) % self.size
+        self.count += 1
+        return row
+
+    def window(self):
+        '''
+        Returns a read-only view of the buffered frames, oldest first, shape (min(count, size), 202).
+        '''
+        end = self._pos + self.size
+        view = self._data[end - min(self.count, self.size):end]
+        view.flags.writeable = False
+        return view
+
+    def __len__(self):
+        return min(self.count, self.size)
+
+# Column indices (into COLUMNS) of the x and y coordinates of each hand, used for normalization
+HAND_XY_COLS = [(np.array([COLUMNS.index(h+'hand_'+str(idx)+'_x') for idx in range(HAND_COLS//3)]),
+                 np.array([COLUMNS.index(h+'hand_'+str(idx)+'_y') for idx in range(HAND_COLS//3)]))
+                for h in ['left','right']]
+# Columns used to check whether a hand was detected in a frame
+HAND_DETECTED_COLS = [COLUMNS.index('lefthand_0_x'), COLUMNS.index('righthand_0_x')]
+# Columns kept as features: both hands, no timestamp or pose
+FEATURE_COLS = slice(1, 1 + 2*HAND_COLS)
+
+def ffill(data):
+    '''
+    Forward-fills NaN values down each column of a 2D array, like DataFrame.fillna(method='ffill').
+    '''
+    idx = np.where(np.isnan(data), 0, np.arange(len(data))[:, None])
+    np.maximum.accumulate(idx, axis=0, out=idx)
+    return data[idx, np.arange(data.shape[1])]
+
 class StaticSignProcessor():
+    # The features are computed from the hand columns only
+    uses_pose = False
+    # Bump when process() or flip_hands() change, so cached feature matrices are rebuilt
+    # (see training_data.py)
+    version = 1
+
     def __init__(self, X_shape=(10,126,1)):
         self.shape = X_shape
     
     def process(self, df):
         '''
-        Processes the parsed data (DataFrame containing MediaPipe data objects)
-        just the cleanup: cut out head and tail, fill nan, (normalize)
+        Processes the parsed data (DataFrame or (num_frames, 202) array laid out like COLUMNS):
+        normalize each hand by its bounding box, cut out head and tail, fill nan,
+        and return the mean of each hand column.
+        The input is not modified.
         '''
-#         # Drop the frames in the beginning and end of the video where no hands are detected
-#         start_idx = (~df['lefthand_0_x'].isna() | ~df['righthand_0_x'].isna()).argmax()
-#         end_idx = len(df) - (df[::-1]['lefthand_0_x'].isna() & df[::-1]['righthand_0_x'].isna()).argmin()
-# #         df = df.iloc[start_idx:end_idx]
-#         # for lda
-# #         df = df.iloc[start_idx:end_idx,1:]
-
-#         # Fill empty values with the previous seen value
-#         df = df.fillna(method='ffill')
-#         df = df.fillna(method='bfill')
-#         df = df.fillna(0.)
-        
-#         # Drop the timeframe and pose data
-#         df = df.iloc[start_idx:end_idx,1:127]
-
-#         if sum(np.isnan(df.to_numpy())) != 0:
-#             print('FAIL: na value found')
-#             print(df)
-
-#         # normalize
-#         data = df.fillna(0).to_numpy()
-#         x = np.linspace(0, len(data.T[0]), self.shape[0], endpoint=False)
-#         norm_data = np.array([np.interp(x, np.arange(len(col)), col) for col in data.T]).T
-#         print(norm_data.shape)
-#         norm_data = np.reshape(norm_data, self.shape)
-#         print(norm_data.shape)
-
-        # normalize x and y positions based on the width of the shoulders and height from shoulders to nose
-#         x1,y1,x2,y2 = df[['pose_11_x','pose_0_y','pose_12_x','pose_12_y']].mean()
-        df_array = df.to_numpy().T  # shape: (202,num_frames)
-#         col_indices = [df.columns.get_loc(col) for col in ('pose_11_x','pose_0_y','pose_12_x','pose_12_y')]
-#         x1,y1,x2,y2 = df_array[col_indices].mean(axis=1)
-
-        for h in ['left','right']:
-            x1,y1,x2,y2 = df.filter(regex=h).filter(regex='_x').min().min(),df.filter(regex=h).filter(regex='_y').min().min(),df.filter(regex=h).filter(regex='_x').max().max(),df.filter(regex=h).filter(regex='_y').max().max()
-            x_cols = [df.columns.get_loc(col) for col in df.filter(regex=h).filter(regex='_x').columns]
-            y_cols = [df.columns.get_loc(col) for col in df.filter(regex=h).filter(regex='_y').columns]
-            df_array[x_cols] = (df_array[x_cols]-min(x1,x2))/(max(x1,x2)-min(x1,x2)+0.000001)
-            df_array[y_cols] = (df_array[y_cols]-min(y1,y2))/(max(y1,y2)-min(y1,y2)+0.000001)
-
-# #         def norm_pts(p):
-# #             px = (p[0]-min(x1,x2))/(max(x1,x2)-min(x1,x2)+0.000001)
-# #             py = (p[1]-min(y1,y2))/(max(y1,y2)-min(y1,y2)+0.000001)
-# #             return (px,py)
-#         x_cols = [df.columns.get_loc(col) for col in df.filter(regex='_x').columns]
-#         y_cols = [df.columns.get_loc(col) for col in df.filter(regex='_y').columns]
-#         df_array[x_cols] = (df_array[x_cols]-min(x1,x2))/(max(x1,x2)-min(x1,x2)+0.000001)
-#         df_array[y_cols] = (df_array[y_cols]-min(y1,y2))/(max(y1,y2)-min(y1,y2)+0.000001)
-# #         df_x = (df.filter(regex='_x')-min(x1,x2))/(max(x1,x2)-min(x1,x2)+0.000001)
-# #         df_y = (df.filter(regex='_y')-min(y1,y2))/(max(y1,y2)-min(y1,y2)+0.000001)
-        norm_df = pd.DataFrame(data=df_array.T, columns=df.columns)
-    
+        data = np.array(df, dtype=np.float64)
+
+        # normalize x and y positions of each hand by the bounding box of that hand over all frames
+        for x_cols, y_cols in HAND_XY_COLS:
+            for cols in (x_cols, y_cols):
+                vals = data[:, cols]
+                lo = np.fmin.reduce(vals, axis=None, initial=np.nan)
+                hi = np.fmax.reduce(vals, axis=None, initial=np.nan)
+                data[:, cols] = (vals-lo)/(hi-lo+0.000001)
+
         # Drop the frames in the beginning and end of the video where no hands are detected
         # Drop the timeframe and pose data
-        start_idx = (~norm_df['lefthand_0_x'].isna() | ~norm_df['righthand_0_x'].isna()).argmax()
-        end_idx = len(norm_df) - (norm_df[::-1]['lefthand_0_x'].isna() & norm_df[::-1]['righthand_0_x'].isna()).argmin()
-        
-        norm_df = norm_df.iloc[start_idx:end_idx,1:127]
+        has_hands = ~np.isnan(data[:, HAND_DETECTED_COLS]).all(axis=1)
+        start_idx = has_hands.argmax()
+        end_idx = len(data) - (~has_hands[::-1]).argmin()
+        data = data[start_idx:end_idx, FEATURE_COLS]
 
         # Fill empty values with the previous seen value
-        norm_df = norm_df.fillna(method='ffill').fillna(method='bfill').fillna(0.)
-        
-        # For classifiers, just return the mean of each column
-        return norm_df.mean().to_numpy()
-
-        # for now, just choose 10 frames from the middle
-#         data = df.iloc[len(df)//3:len(df)//3+10].mean().to_numpy()
-#         if sum(np.isnan(data)) != 0:
-#             print(sum(np.isnan(data)))
-#         norm_data = np.reshape(data, self.shape)
-#         assert data.shape == self.shape
-#         return data
+        data = ffill(data)
+        data = ffill(data[::-1])[::-1]
+        data[np.isnan(data)] = 0.
 
+        # For classifiers, just return the mean of each column
+        return data.mean(axis=0)
 
     def flip_hands(self, df_array):
         assert len(df_array) == 126
@@ -233,25 +459,145 @@ class StaticSignProcessor():
     def generate_more_data(self, df_array, n=10, std=0.1):
         '''
         Generate more data from a single sample by adding noise
+        Returns a list of n samples, see augment().
         '''
-        samples = []
-        
-        for i in range(n):
-            noise = np.random.normal(0, std, df_array.shape)
-            # randomly select up to 5 joints to perturb
-            perturb_indices = np.random.choice(len(df_array.T), np.random.choice(5), replace=False)
-            df_array.T[perturb_indices] = df_array.T[perturb_indices] + np.random.normal(0, std, df_array.T[perturb_indices].shape)
-            samples.append(df_array + noise)
+        return list(self.augment(df_array, n, std))
 
+    def augment(self, df_array, n=10, std=0.1, rng=None):
+        '''
+        Returns n noisy copies of a sample, as an (n, 126) array, or of each of m samples,
+        as an (m, n, 126) array. Every feature gets gaussian noise of std, and up to 4 randomly
+        selected joints of each copy are perturbed a second time.
+        rng is a numpy Generator (default: a new unseeded one). The input is not modified.
+        '''
+        rng = rng or np.random.default_rng()
+        df_array = np.asarray(df_array, dtype=np.float64)
+        num_features = df_array.shape[-1]
+        samples = df_array[..., None, :] + rng.normal(0, std, df_array.shape[:-1] + (n, num_features))
+
+        flat = samples.reshape(-1, num_features)
+        # randomly select up to 5 joints to perturb: 0 to 4 distinct joints per copy
+        joints = rng.random(flat.shape).argsort(axis=1)[:, :4]
+        num_perturbed = rng.integers(0, 5, len(flat))
+        noise = rng.normal(0, std, joints.shape) * (np.arange(4) < num_perturbed[:, None])
+        flat[np.arange(len(flat))[:, None], joints] += noise
         return samples
 
+class SlidingWindowFeatures(StaticSignProcessor):
+    '''
+    Incremental version of StaticSignProcessor.process over the last window_size frames of a stream.
+    push() adds one landmark row and features() returns the same feature vector that
+    process() would return for the window, in constant time per frame regardless of window_size.
+
+    Per hand, it keeps:
+    - prefix sums of the forward-filled hand columns, so any range of frames can be summed in O(1)
+    - monotonic deques of the per-frame x/y min and max, for the bounding-box normalization
+    - the frame indices where the hand was detected, to account for back-filled leading frames
+    '''
+    def __init__(self, window_size=10):
+        super(SlidingWindowFeatures, self).__init__((2*HAND_COLS,))
+        assert window_size > 0, 'Window size must be a positive number'
+        self.window_size = window_size
+        self._filled = np.zeros((window_size, 2, HAND_COLS))
+        self._prefix = np.zeros((window_size+1, 2, HAND_COLS))
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self._last = np.full((2, HAND_COLS), np.nan)
+        self._prefix[0] = 0.
+        self._detected = [deque(), deque()]
+        self._any_detected = deque()
+        # (frame index, value) pairs for the min/max of x and y of each hand
+        self._mins = [[deque(), deque()], [deque(), deque()]]
+        self._maxs = [[deque(), deque()], [deque(), deque()]]
+
+    def push(self, row):
+        t = self.count
+        oldest = t - self.window_size + 1
+        hands = np.reshape(row[FEATURE_COLS], (2, HAND_COLS))
+        detected = ~np.isnan(hands[:, 0])
+        self._last[detected] = hands[detected]
+
+        # forward-filled values and their running sum
+        filled = self._last
+        self._filled[t % self.window_size] = filled
+        prev = self._prefix[t % (self.window_size+1)]
+        self._prefix[(t+1) % (self.window_size+1)] = prev + np.nan_to_num(filled)
+
+        for h in range(2):
+            if detected[h]:
+                self._detected[h].append(t)
+                for axis in range(2):
+                    coords = hands[h, axis::3]
+                    lo, hi = coords.min(), coords.max()
+                    mins, maxs = self._mins[h][axis], self._maxs[h][axis]
+                    while mins and mins[-1][1] >= lo:
+                        mins.pop()
+                    mins.append((t, lo))
+                    while maxs and maxs[-1][1] <= hi:
+                        maxs.pop()
+                    maxs.append((t, hi))
+            # expire frames that left the window
+            while self._detected[h] and self._detected[h][0] < oldest:
+                self._detected[h].popleft()
+            for axis in range(2):
+                for q in (self._mins[h][axis], self._maxs[h][axis]):
+                    while q and q[0][0] < oldest:
+                        q.popleft()
+        if detected.any():
+            self._any_detected.append(t)
+        while self._any_detected and self._any_detected[0] < oldest:
+            self._any_detected.popleft()
+        self.count += 1
+
+    def features(self):
+        '''
+        Returns the (126,) feature vector of the current window.
+        '''
+        out = np.zeros((2, HAND_COLS))
+        if not self._any_detected:
+            return out.flatten()
+        # frames before the first and after the last detection are trimmed
+        start, end = self._any_detected[0], self._any_detected[-1] + 1
+        n = self.window_size + 1
+        total = self._prefix[end % n] - self._prefix[start % n]
+        first_filled = np.nan_to_num(self._filled[start % self.window_size])
+        for h in range(2):
+            if not self._detected[h]:
+                continue
+            # frames before the first detection of this hand are back-filled with it
+            first = self._detected[h][0]
+            back_filled = self._filled[first % self.window_size][h]
+            hand_sum = total[h] + (first-start) * (back_filled - first_filled[h])
+            out[h] = hand_sum / (end-start)
+            for axis in range(2):
+                lo, hi = self._mins[h][axis][0][1], self._maxs[h][axis][0][1]
+                out[h, axis::3] = (out[h, axis::3]-lo)/(hi-lo+0.000001)
+        return out.flatten()
+
+    def __len__(self):
+        return min(self.count, self.window_size)
+
 
 sampled_words = ['LETTER-'+let for let in string.ascii_uppercase]
-encoder = preprocessing.LabelEncoder()
-encoder.fit(sampled_words)
+# Class index -> word, in the same (sorted) order as the LabelEncoder the model was trained with
+class_labels = np.array(sorted(sampled_words))
 
-def pred_class_to_letter(pred_class):
-    return encoder.inverse_transform(np.array([pred_class]))
+def model_labels(model=None):
+    '''
+    Returns the word of each class (predict_proba column) of a model: exported models
+    (linear_model.LinearModel) have their own labels, sklearn models are trained on
+    the class indices of class_labels.
+    '''
+    labels = getattr(model, 'labels', None)
+    if labels is not None:
+        return labels
+    classes = getattr(model, 'classes_', None)
+    return class_labels if classes is None else class_labels[classes]
+
+def pred_class_to_letter(pred_class, model=None):
+    return model_labels(model)[[pred_class]]
 
 ################## OLD STUFF ###################
 
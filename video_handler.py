@@ -1,71 +1,215 @@
-import os, sys
+import os, sys, time
 import cv2
 import numpy as np
 import pandas as pd
 import string
 import mediapipe as mp
-import pickle
 from zipfile import ZipFile
-from utils import StaticSignProcessor, mp_process_image, generate_dataframe, annotate_image, pred_class_to_letter
+from model_registry import get_model
+from utils import SlidingWindowFeatures, LandmarkRingBuffer, LandmarkExtractor, annotate_image, pred_class_to_letter
+from frame_utils import FrameRing, mirror
+from pipeline import RecognitionPipeline
+from scheduler import AdaptiveScheduler, FULL, REUSE
+import profiling
 
+# Threaded pipeline settings: how many captured frames may wait for recognition,
+# and which frame to drop when recognition can't keep up ('oldest', 'newest', 'block')
+PIPELINE_QUEUE_SIZE = 2
+PIPELINE_DROP_POLICY = 'oldest'
+# The features don't use the pose, it is only drawn on the webcam image.
+# Run the pose graph every POSE_STRIDE frames (0 to not track or draw the pose at all)
+POSE_STRIDE = 3
+# For slow machines: run MediaPipe on frames downscaled to this width (None for full resolution),
+# and on a crop around the previous frame's hands once one is found
+INFERENCE_WIDTH = None
+HAND_ROI = False
+# Target per-frame processing time in ms. When set, an AdaptiveScheduler decides per frame
+# whether to run the full recognition path, skip classification or reuse the last landmarks.
+# None always runs the full path.
+LATENCY_BUDGET_MS = None
+# Frames are mirrored once into a ring of preallocated buffers, and everything after that
+# (MediaPipe, drawing, display) works on the mirrored frame. In threaded mode the UI thread
+# holds on to returned frames while recognition moves on, so the ring needs one buffer for the
+# frame being processed, one per result queued for the UI (pipeline results queue: 1) and one
+# for the frame the UI is displaying. The frames the pipeline reports in use are skipped,
+# so a frame is never written while the UI can still read it.
+FRAME_BUFFERS = 1 + 1 + 1
+# Draw the landmarks and the prediction into the frame with cv2. The app turns this off
+# and draws them as Kivy instructions over the raw frame instead (see config.LandmarkOverlay).
+DRAW_ON_FRAME = True
 
-# load the model
-with open('saved_model.pkl', 'rb') as f:
-    model = pickle.load(f)
+
+def ensure_test_data():
+    '''
+    Unzips the pre-recorded test videos into test_webcam_data/ if needed.
+    '''
+    if not os.path.isdir('test_webcam_data'):
+        print('Unzipping test data...')
+        with ZipFile('test_webcam_data.zip','r') as zipobj:
+            zipobj.extractall()
 
 # TODO change to generic video src handler
 class VideoHandler():
-    def __init__(self, vid_src=0):
-        self.cap = cv2.VideoCapture(vid_src)
-        self.processor = StaticSignProcessor((126,))
-        self.timestamps = []
-        self.hand_results = []
-        self.pose_results = []
-        self.framecount = 0
+    '''
+    With threaded=True, capture and recognition run on background threads
+    (see pipeline.RecognitionPipeline) and get_next_frame only returns the newest result.
+    The pipeline is started on the first call to get_next_frame.
+    buffer_size is the number of frames the prediction is made over.
+    pose_stride, inference_width and hand_roi are passed on to the LandmarkExtractor.
+    latency_budget_ms enables the adaptive scheduler (see scheduler.AdaptiveScheduler).
+    With a predictor (batch_predictor.BatchPredictor), predictions are batched with other
+    sessions and applied asynchronously when their batch is done.
+    With draw_on_frame=False, frames are returned without annotations; the landmarks to draw
+    over the latest frame returned by get_next_frame are in display_landmarks.
+    With vid_src=None there is no capture: the caller passes in frames (process_frame) or
+    landmark rows (process_landmarks).
+    '''
+    def __init__(self, vid_src=0, threaded=False, queue_size=PIPELINE_QUEUE_SIZE, drop_policy=PIPELINE_DROP_POLICY,
+                 buffer_size=10, pose_stride=POSE_STRIDE, inference_width=INFERENCE_WIDTH, hand_roi=HAND_ROI,
+                 latency_budget_ms=LATENCY_BUDGET_MS, predictor=None, draw_on_frame=DRAW_ON_FRAME):
+        self.cap = cv2.VideoCapture(vid_src) if vid_src is not None else None
+        self.buffer_size = buffer_size
+        self.processor = SlidingWindowFeatures(buffer_size)
+        self.landmarks = LandmarkRingBuffer(buffer_size)
+        self.pose_stride = 1 if self.processor.uses_pose else pose_stride
+        self.inference_width = inference_width
+        self.hand_roi = hand_roi
+        # MediaPipe graphs are created on the first frame, so handlers that only play videos don't load them
+        self.extractor = None
+        # set by reset(): the next frame gets a fresh extractor, without the hand ROI and
+        # tracking state of the previous video
+        self._reset_extractor = False
+        self.frames = FrameRing(FRAME_BUFFERS)
+        # MediaPipe results of the latest frame with hands, for drawing
+        self.last_results = None
+        self.draw_on_frame = draw_on_frame
+        # Landmark row (see utils.COLUMNS) of the latest processed frame, None without hands,
+        # and the one matching the latest frame returned by get_next_frame
+        self.overlay_landmarks = None
+        self.display_landmarks = None
         self.prediction = 'Neutral'
         self.score = ''
         self.pred_thresh = 0.7
         # self.colormap = {'No hands detected': (0,0,255), 'Neutral': (255,0,0)}
+        self.pipeline = RecognitionPipeline(self, queue_size, drop_policy) if threaded else None
+        self.scheduler = AdaptiveScheduler(latency_budget_ms) if latency_budget_ms else None
+        self.predictor = predictor
+        # incremented whenever the buffer is reset, so late async predictions can be ignored
+        self._generation = 0
     
     def load_source(self, vid_src):
-        self.cap.release()
-        self.cap = cv2.VideoCapture(vid_src)
+        '''
+        Switches to another video source. In threaded mode the pipeline is restarted,
+        also after the previous source ran out.
+        '''
+        if self.pipeline is not None:
+            self.pipeline.stop()
+        if self.cap is not None:
+            self.cap.release()
+        self.cap = cv2.VideoCapture(vid_src) if vid_src is not None else None
+        if self.pipeline is not None:
+            self.pipeline.start()
+
+    def reset(self):
+        '''
+        Clears the landmark buffer and the last prediction, e.g. before switching to another video.
+        The MediaPipe graphs are replaced on the next frame, by the thread that runs them.
+        '''
+        self._reset_extractor = True
+        self.landmarks.reset()
+        self.processor.reset()
+        self.last_results = None
+        self.overlay_landmarks = None
+        self.prediction = 'Neutral'
+        self.score = ''
+        self._generation += 1
+
+    def read_frame(self):
+        '''
+        Reads the next raw frame from the video source, or None if the feed is closed.
+        '''
+        if self.cap is None or not self.cap.isOpened():
+            return
+        with profiling.timer('read'):
+            success, image = self.cap.read()
+        if not success:
+            return
+        return image
 
     def generate_buffer(self, frame, buffer_size=10, sliding_window=1, callback=None):
         '''
         Generates a buffer of fixed length from a live video stream
         to be processed and passed into the recognition model.
+        The landmarks of each frame are extracted once into a ring buffer (see LandmarkRingBuffer)
+        and the window features are updated incrementally (see SlidingWindowFeatures).
         
         Returns:
-        A dict containing timestamps, hand_results, and pose_results
+        A read-only (buffer_size, 202) view of the latest landmark rows
         if the buffer condition is met
         '''
         assert buffer_size > 0, 'Buffer size must be a positive number'
         assert sliding_window > 0, 'Sliding window size must be a positive number'
         assert buffer_size > sliding_window, 'Sliding window must be smaller than buffer'
+        if self.landmarks.size != buffer_size:
+            self.landmarks = LandmarkRingBuffer(buffer_size)
+            self.processor = SlidingWindowFeatures(buffer_size)
         
-        hand_result, pose_result = mp_process_image(frame)
+        if self._reset_extractor:
+            self._reset_extractor = False
+            if self.extractor is not None:
+                self.extractor.close()
+                self.extractor = None
+        if self.extractor is None:
+            self.extractor = LandmarkExtractor(num_hands=1, pose_stride=self.pose_stride, inference_width=self.inference_width,
+                                               hand_roi=self.hand_roi, mirrored=True)
+        hand_result, pose_result = self.extractor.process(frame)
         if not hand_result.multi_handedness:
-            self.timestamps = []
-            self.hand_results = []
-            self.pose_results = []
-            self.framecount = 0
-            return
+            self.last_results = None
+            return self._update_window(None, buffer_size, sliding_window, callback)
 
         # time is a construct
-        self.timestamps.append(0.0)
-        self.hand_results.append(hand_result)
-        self.pose_results.append(pose_result)
-        self.framecount += 1
-
-        if (self.framecount % buffer_size == 0) or \
-            (self.framecount % sliding_window == 0 and self.framecount > buffer_size):
-            buf = {'timestamps': self.timestamps,
-                   'hand_results': self.hand_results,
-                   'pose_results': self.pose_results}
-            self.timestamps = self.timestamps[sliding_window:]
-            self.hand_results = self.hand_results[sliding_window:]
-            self.pose_results = self.pose_results[sliding_window:]
+        with profiling.timer('parse'):
+            row = self.landmarks.push(hand_result, pose_result, 0.0)
+        self.last_results = (hand_result, pose_result)
+        return self._update_window(row, buffer_size, sliding_window, callback)
+
+    def process_landmarks(self, row):
+        '''
+        Recognition from a landmark row (see utils.COLUMNS) extracted elsewhere, e.g. in a
+        recognition_server worker, or None if no hands were found in the frame.
+        Updates the window and the prediction the same way as process_frame, without
+        the scheduler or any drawing, and returns the prediction and score.
+        '''
+        if row is not None:
+            with profiling.timer('parse'):
+                row = self.landmarks.push_row(row)
+        buf = self._update_window(row, self.buffer_size, 1)
+        if buf is not None:
+            self.predict(buf)
+        if row is None:
+            self.prediction = 'No hands detected'
+            self.score = ''
+        return self.prediction, self.score
+
+    def _update_window(self, row, buffer_size, sliding_window, callback=None):
+        '''
+        Adds the newest landmark row (already in the ring buffer) to the window features,
+        or clears the window if row is None. Returns the window if a prediction is due.
+        '''
+        if row is None:
+            self.landmarks.reset()
+            self.processor.reset()
+            self.overlay_landmarks = None
+            self._generation += 1
+            return
+        self.processor.push(row)
+        # a copy, as the ring buffer row will be overwritten
+        self.overlay_landmarks = row.copy()
+        framecount = self.landmarks.count
+
+        if (framecount % buffer_size == 0) or \
+            (framecount % sliding_window == 0 and framecount > buffer_size):
+            buf = self.landmarks.window()
             if callback:
                 callback(buf)
             return buf
@@ -77,50 +221,113 @@ class VideoHandler():
         - None if webcam feed is closed or can't read feed
         - annotated image if feed is open
         - annotated image, prediction, score if feed is open and buffer condition is met
+        In threaded mode, returns None until the pipeline has a new result.
         '''
-        if not self.cap.isOpened():
-            return
-        success, image = self.cap.read()
-        if not success:
+        if self.pipeline is not None:
+            result = self.get_latest_result()
+            if result is None:
+                return
+            image, prediction, score, _, self.display_landmarks = result
+            return image, prediction, score
+
+        image = self.read_frame()
+        if image is None:
             return
-        
-        buf = self.generate_buffer(image, buffer_size=10, sliding_window=1, callback=self.predict)
+        result = self.process_frame(image)
+        self.display_landmarks = self.overlay_landmarks
+        return result
+
+    def get_latest_result(self):
+        '''
+        Threaded mode only. Returns the newest (image, prediction, score, timestamp, landmarks)
+        produced by the pipeline since the last call, or None.
+        '''
+        if not self.pipeline.is_running() and not self.pipeline.finished:
+            self.pipeline.start()
+        return self.pipeline.get_latest()
+
+    def process_frame(self, image):
+        '''
+        Runs recognition on a single frame and returns the annotated image, prediction, score.
+        The returned image is mirrored (see FRAME_BUFFERS) and annotated in place.
+        With a scheduler, the landmarks or the prediction of previous frames may be reused.
+        '''
+        decision = self.scheduler.decide() if self.scheduler else FULL
+        frame_start = stage_start = time.perf_counter()
+        with profiling.timer('mirror'):
+            in_use = self.pipeline.frames_in_use() if self.pipeline is not None else ()
+            image = mirror(image, self.frames.next(image.shape, in_use=in_use))
+        if decision != REUSE:
+            buf = self.generate_buffer(image, buffer_size=self.buffer_size, sliding_window=1)
+            if self.scheduler:
+                self.scheduler.record('landmarks', time.perf_counter() - stage_start)
+            if buf is not None and decision == FULL:
+                stage_start = time.perf_counter()
+                self.predict(buf)
+                if self.scheduler:
+                    self.scheduler.record('classify', time.perf_counter() - stage_start)
         
         # if blur:
         #     image = cv2.blur(image, (25,25))
-        if self.hand_results:
-            image = annotate_image(image, self.hand_results[-1], self.pose_results[-1])
-        else:
+        stage_start = time.perf_counter()
+        if self.last_results and self.draw_on_frame:
+            with profiling.timer('annotate'):
+                image = annotate_image(image, *self.last_results, mirrored=True)
+        elif not self.last_results:
             self.prediction = 'No hands detected'
             self.score = ''
-        image = cv2.flip(image, 1)
-        if self.prediction:
+        if self.prediction and self.draw_on_frame:
             if self.prediction == 'No hands detected':
                 color = (0,0,255)
             elif self.prediction == 'Neutral':
                 color = (255,0,0)
             else:
                 color = (0,150,0)
-            cv2.putText(image, self.prediction + '  ' + self.score, (50,80), cv2.FONT_HERSHEY_SIMPLEX, 2, color, 4)
+            with profiling.timer('text'):
+                cv2.putText(image, self.prediction + '  ' + self.score, (50,80), cv2.FONT_HERSHEY_SIMPLEX, 2, color, 4)
+        now = time.perf_counter()
+        profiling.record('frame', now - frame_start)
+        if self.scheduler:
+            self.scheduler.record('annotate', now - stage_start)
+            self.scheduler.frame_done(now - frame_start)
 
         return image, self.prediction, self.score
 
+    def get_metrics(self):
+        '''
+        Returns the scheduler's decisions, stage costs and achieved fps, or None without a scheduler.
+        '''
+        if self.scheduler:
+            return self.scheduler.metrics()
+
     def predict(self, buf):
-        # Make a prediction on the generated buffer
-        df = generate_dataframe(buf)
-        data = self.processor.process(df)
-        pred_prob = model.predict_proba([data])[0]
-        pred_class = list(pred_prob).index(max(pred_prob))
+        # Make a prediction on the generated buffer.
+        # The features of buf are kept up to date by the processor as frames come in.
+        with profiling.timer('features'):
+            data = self.processor.features()
+        if self.predictor:
+            generation = self._generation
+            self.predictor.submit(data, callback=lambda pred_prob: \
+                generation == self._generation and self.set_prediction(pred_prob))
+            return
+        with profiling.timer('predict'):
+            pred_prob = get_model().predict_proba([data])[0]
+        self.set_prediction(pred_prob)
+
+    def set_prediction(self, pred_prob):
+        pred_class = pred_prob.argmax()
         if max(pred_prob) < self.pred_thresh:
             self.prediction = 'Neutral'
             self.score = ''
         else:
-            self.prediction = pred_class_to_letter(pred_class)[0]
+            model = self.predictor.model if self.predictor and self.predictor.model else get_model()
+            self.prediction = pred_class_to_letter(pred_class, model)[0]
             self.score = str(round(max(pred_prob),2))
     
     def get_frame(self):
-        if self.cap.isOpened():
-            success, frame = self.cap.read()
+        if self.cap is not None and self.cap.isOpened():
+            with profiling.timer('guide_read'):
+                success, frame = self.cap.read()
             return frame
     
     def stream_webcam(self):
@@ -148,11 +355,15 @@ class VideoHandler():
         A helper function for evaluating the recognition model's performance.
         It uses pre-recorded videos in test_webcam_data to test each letter.
         The videos in the test data were not used to train the model.
+        Without show, this runs the parallel, cached evaluation in evaluation.py.
         '''
-        if not os.path.isdir('test_webcam_data'):
-            print('Unzipping test data...')
-            with ZipFile('test_webcam_data.zip','r') as zipobj:
-                zipobj.extractall()
+        if not show:
+            from evaluation import evaluate
+            evaluate(buffer_size=self.buffer_size, pred_thresh=self.pred_thresh,
+                     inference_width=self.inference_width, hand_roi=self.hand_roi)
+            return
+
+        ensure_test_data()
 
         accuracy = 0
         for i in string.ascii_uppercase:
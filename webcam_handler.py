@@ -4,15 +4,10 @@ import numpy as np
 import pandas as pd
 import string
 import mediapipe as mp
-import pickle
 from zipfile import ZipFile
+from model_registry import get_model
 from utils import StaticSignProcessor, mp_process_image, generate_dataframe, annotate_image, pred_class_to_letter
 
-
-# load the model
-with open('saved_model.pkl', 'rb') as f:
-    model = pickle.load(f)
-
 # TODO change to generic video src handler
 class WebcamHandler():
     def __init__(self, vid_src=0):
@@ -82,13 +77,14 @@ class WebcamHandler():
             # Make a prediction on the generated buffer
             df = generate_dataframe(buf)
             data = self.processor.process(df)
+            model = get_model()
             pred_prob = model.predict_proba([data])[0]
-            pred_class = list(pred_prob).index(max(pred_prob))
+            pred_class = pred_prob.argmax()
             if max(pred_prob) < pred_thresh:
                 # print('PREDICTED: NEUTRAL', max(pred_prob))
                 pass
             else:
-                prediction = pred_class_to_letter(pred_class)[0]
+                prediction = pred_class_to_letter(pred_class, model)[0]
                 score = str(round(max(pred_prob),2))
                 # print('PREDICTED:', prediction, score)
 
@@ -129,7 +125,13 @@ class WebcamHandler():
         A helper function for evaluating the recognition model's performance.
         It uses pre-recorded videos in test_webcam_data to test each letter.
         The videos in the test data were not used to train the model.
+        Without show, this runs the parallel, cached evaluation in evaluation.py.
         '''
+        if not show:
+            from evaluation import evaluate
+            evaluate(pred_thresh=0.3)
+            return
+
         if not os.path.isdir('test_webcam_data'):
             print('Unzipping test data...')
             with ZipFile('test_webcam_data.zip','r') as zipobj:
@@ -153,7 +155,7 @@ class WebcamHandler():
                             break
                 except:
                     break
-            final_pred = max(set(tmp), key = tmp.count)
+            final_pred = max(set(tmp), key = tmp.count) if tmp else None
             print('prediction:', final_pred)
             if i == final_pred:
                 print('CORRECT')